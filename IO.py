@@ -1,6 +1,9 @@
 #!/usr/bin/python
 """
-Simple functions for loading or saving a single array as a *.txt file.
+Simple functions for loading or saving a single array as a *.txt file (all at
+once, or a chunk at a time), for saving a fitted interpolant (see rbf2.fit)
+as a single compact binary file, and for saving a sparse interpolation
+operator (see rbf2.operator).
 """
 ################################################################################
 
@@ -20,6 +23,96 @@ def loadArray(fileName) :
 
 def saveArray(fileName, values) :
     with open(fileName, "w") as fh :
-        for i in range(len(values)) :
-            fh.write('{0:1.15e}\n'.format(values[i]))
+        writeArray(fh, values)
 
+################################################################################
+
+def writeArray(fh, values) :
+    for i in range(len(values)) :
+        fh.write('{0:1.15e}\n'.format(values[i]))
+
+################################################################################
+
+def loadChunks(fileName, chunkSize) :
+    # Read the file a piece at a time, so it never has to fit in memory.
+    chunk = []
+    with open(fileName) as fh :
+        for line in fh :
+            chunk.append(np.float64(line.strip()))
+            if len(chunk) == chunkSize :
+                yield np.array(chunk)
+                chunk = []
+    if len(chunk) > 0 :
+        yield np.array(chunk)
+
+################################################################################
+
+def saveChunks(fileName, chunks) :
+    with open(fileName, "w") as fh :
+        for values in chunks :
+            writeArray(fh, values)
+
+################################################################################
+
+# A model file starts with the 8-byte string MODEL_MAGIC, followed by a header
+# of MODEL_NUM_INTS int64 values and MODEL_NUM_FLOATS float64 values.  The
+# arrays come after that, in the order listed in MODEL_ARRAYS.  Every entry is
+# 8 bytes wide, so each array can be memory-mapped straight from the file.
+
+MODEL_MAGIC = b"RBF2MDL1"
+MODEL_NUM_INTS = 6
+MODEL_NUM_FLOATS = 5
+MODEL_ARRAYS = (("xmc", np.float64), ("ymc", np.float64) \
+, ("x", np.float64), ("y", np.float64) \
+, ("ptr", np.int64), ("ind", np.int64) \
+, ("lamPtr", np.int64), ("lam", np.float64))
+
+################################################################################
+
+def saveModel(fileName, model) :
+    ints = np.array([model["rbfPow"], model["deg"], len(model["x"]) \
+    , len(model["xmc"]), len(model["ind"]), len(model["lam"])], dtype=np.int64)
+    floats = np.array([model["xavg"], model["yavg"], model["alp"] \
+    , model["w"], model["ell"]], dtype=np.float64)
+    with open(fileName, "wb") as fh :
+        fh.write(MODEL_MAGIC)
+        fh.write(ints.tobytes())
+        fh.write(floats.tobytes())
+        for name, dtype in MODEL_ARRAYS :
+            fh.write(np.ascontiguousarray(model[name], dtype=dtype).tobytes())
+
+################################################################################
+
+def loadModel(fileName) :
+    with open(fileName, "rb") as fh :
+        if fh.read(len(MODEL_MAGIC)) != MODEL_MAGIC :
+            s = "\"" + fileName + "\" is not a saved rbf2 model."
+            raise ValueError(s)
+        ints = np.fromfile(fh, dtype=np.int64, count=MODEL_NUM_INTS)
+        floats = np.fromfile(fh, dtype=np.float64, count=MODEL_NUM_FLOATS)
+    rbfPow, deg, numNodes, numSubd, numInd, numLam = [int(v) for v in ints]
+    model = {}
+    model["rbfPow"] = rbfPow
+    model["deg"] = deg
+    model["xavg"], model["yavg"], model["alp"], model["w"], model["ell"] = floats
+    sizes = {"xmc" : numSubd, "ymc" : numSubd, "x" : numNodes, "y" : numNodes \
+    , "ptr" : numSubd + 1, "ind" : numInd, "lamPtr" : numSubd + 1, "lam" : numLam}
+    # Memory-map the arrays, so only the pages that are used get read from disk.
+    offset = len(MODEL_MAGIC) + 8 * (MODEL_NUM_INTS + MODEL_NUM_FLOATS)
+    for name, dtype in MODEL_ARRAYS :
+        model[name] = np.memmap(fileName, dtype=dtype, mode="r", offset=offset \
+        , shape=(sizes[name],))
+        offset += 8 * sizes[name]
+    return model
+
+################################################################################
+
+def saveOperator(fileName, W) :
+    from scipy.sparse import save_npz
+    save_npz(fileName, W.tocsr(), compressed=False)
+
+################################################################################
+
+def loadOperator(fileName) :
+    from scipy.sparse import load_npz
+    return load_npz(fileName).tocsr()
@@ -0,0 +1,291 @@
+#!/usr/bin/python
+"""
+Choose the grid of subdomains (nSubd x mSubd) and the way to run the
+interpolation (plain rbf2.interp, rbf2.interp with reorder=True, or
+shards.interp with several workers), by predicting how long each choice takes.
+
+A few subdomains of each candidate grid are solved and timed (the probes), and
+a cost model is fit to the timings:
+    assembly ~ n**2,  solve ~ n**3,  evaluation ~ ne * n,
+where n is the number of nodes in a stencil and ne is the number of evaluation
+points in a subdomain.  Searching for the points of a subdomain (rbf2.interp
+without reorder) costs a fixed amount per point, for every subdomain.  The
+probes also give leave-one-out errors (see rbf2.localLoocv), which are used to
+throw out grids that are not accurate enough.  These errors come from a few
+subdomains only, so they are noisy.  Half of the probed subdomains are the ones
+with the smallest stencils, where the error is largest, and by default a grid
+has to be as accurate as the grid rbf2.rectangles would pick.
+
+Grids coarser than the one rbf2.rectangles would pick have much bigger
+stencils, and a single probe of one can take longer than the whole
+interpolation.  So the n**3 cost of every grid is estimated from its stencil
+counts alone, and grids that are clearly more expensive are never probed.
+
+If the sharded mode is chosen (and run is True), worker processes are started.
+With the spawn or forkserver start method (Windows, macOS, and Linux from
+Python 3.14), they re-import the caller's __main__, so a script that calls
+autotune must do so under if __name__ == "__main__".
+"""
+################################################################################
+
+import multiprocessing
+import os
+from time import perf_counter
+import numpy as np
+
+import rbf2
+import shards
+
+# Rough cost (in seconds) of starting a worker process, where it cannot be
+# measured safely (see autotune).
+SPAWN_TIME = 0.5
+
+################################################################################
+
+def noop() :
+    pass
+
+################################################################################
+
+def candidates(x, y, xe, ye, numP) :
+    """
+    Grids to try, from coarse to fine, each with its nodes per stencil and
+    evaluation points per subdomain, and which of them rbf2.rectangles picks.
+    """
+    # x                                             normalized x-coords of nodes
+    # y                                             normalized y-coords of nodes
+    # xe                                         normalized x-coords of eval pts
+    # ye                                         normalized y-coords of eval pts
+    # numP                                        number of polynomial functions
+    
+    ab = np.hstack((x, xe))
+    cd = np.hstack((y, ye))
+    a, b, c, d = np.min(ab), np.max(ab), np.min(cd), np.max(cd)
+    nSubd0, mSubd0 = rbf2.startingShape(a, b, c, d)
+    
+    # Refine by a factor of sqrt(2) each time, until some stencil would not
+    # have enough nodes for rbf2.interp.  rbf2.rectangles refines by a factor
+    # of 2 instead, until some stencil has fewer than 10*numP nodes.
+    out = []
+    ref = -1
+    for j in range(40) :
+        nSubd = int(round(nSubd0 * 2**(j/2)))
+        mSubd = int(round(mSubd0 * 2**(j/2)))
+        if (len(out) > 0) and (out[-1][0] == nSubd) and (out[-1][1] == mSubd) :
+            continue
+        xmc, ymc, w, ell = rbf2.grid(a, b, c, d, nSubd, mSubd)
+        n = rbf2.stencilCounts(np.bincount(rbf2.whichRectangle(x, y, xmc, ymc, w, ell) \
+        , minlength=len(xmc)), nSubd, mSubd)
+        ne = np.bincount(rbf2.whichRectangle(xe, ye, xmc, ymc, w, ell), minlength=len(xmc))
+        if np.min(n) < round(1.5 * numP) :
+            break
+        out.append((nSubd, mSubd, xmc, ymc, w, ell, n, ne))
+        if (ref == -1) and (j % 2 == 0) and (np.min(n) < 10 * numP) :
+            ref = len(out) - 1
+    
+    if ref == -1 :
+        ref = len(out) - 1
+    
+    return out, ref
+
+################################################################################
+
+def probe(x, y, f, xe, ye, xmc, ymc, w, ell, rbfPow, deg, cells) :
+    """
+    Time the parts of the local problems of a few subdomains.
+    """
+    # x                                             normalized x-coords of nodes
+    # y                                             normalized y-coords of nodes
+    # f                                        known values of function on nodes
+    # xe                                         normalized x-coords of eval pts
+    # ye                                         normalized y-coords of eval pts
+    # xmc                                  x-coords of centers of the subdomains
+    # ymc                                  y-coords of centers of the subdomains
+    # w                                             half-width of each subdomain
+    # ell                                          half-length of each subdomain
+    # rbfPow                                                 exponent of phs rbf
+    # deg                                     largest polynomial degree in basis
+    # cells                                       indices of subdomains to probe
+    
+    # Each row is (n, ne, search, assembly, solve, evaluation), and err holds
+    # the leave-one-out errors of the nodes that belong to the subdomains.  The
+    # LU factorization from the timed solve is reused for the errors.
+    from scipy.linalg import lu_factor, lu_solve
+    rows = []
+    err = []
+    own = rbf2.whichRectangle(x, y, xmc, ymc, w, ell)
+    
+    for i in cells :
+        t0 = perf_counter()
+        ind = np.array(rbf2.inrectangle(x, y, xmc[i], ymc[i], 3*ell, 3*w), dtype=int)
+        IND = rbf2.inrectangle(xe, ye, xmc[i], ymc[i], ell, w)
+        t1 = perf_counter()
+        lu = None
+        if rbfPow == -1 :
+            A = rbf2.polymat(x[ind], y[ind], deg).T
+            t2 = perf_counter()
+            lam = np.linalg.lstsq(A, f[ind], rcond=None)[0]
+        else :
+            A = rbf2.localMatrix(x[ind], y[ind], rbfPow, deg)
+            t2 = perf_counter()
+            lu = lu_factor(A)
+            lam = lu_solve(lu, np.hstack((f[ind], np.zeros(A.shape[0] - len(ind)))))
+        t3 = perf_counter()
+        rbf2.localEval(xe[IND], ye[IND], x[ind], y[ind], lam, rbfPow, deg)
+        t4 = perf_counter()
+        rows.append((len(ind), len(IND), t1 - t0, t2 - t1, t3 - t2, t4 - t3))
+        e = rbf2.localLoocv(x[ind], y[ind], f[ind], rbfPow, deg, lu=lu)
+        err.append(e[own[ind] == i])
+    
+    return np.array(rows), np.hstack(err)
+
+################################################################################
+
+def coef(g, t) :
+    """
+    Least squares fit of t = c * g, with c >= 0.
+    """
+    return max(np.sum(g * t) / max(np.sum(g * g), 1e-300), 0)
+
+################################################################################
+
+def autotune(x, y, f, xe, ye, rbfPow=-1, deg=-1, maxError=-1, numWorkers=-1 \
+, numProbes=8, maxCost=4, run=True) :
+    """
+    Pick the grid and execution mode with the smallest predicted wall time.
+    """
+    # x                                     x-coords where you KNOW the function
+    # y                                     y-coords where you KNOW the function
+    # f                                        known values of function on nodes
+    # xe                                    x-coords where you WANT the function
+    # ye                                    y-coords where you WANT the function
+    # OPTIONAL:
+    # rbfPow                                                 exponent of phs rbf
+    # deg                                     largest polynomial degree in basis
+    # maxError            accuracy floor, max rms LOOCV error relative to max|f|
+    #                     (default: the error of the rbf2.rectangles grid)
+    # numWorkers                number of workers for shards (default: all cpus)
+    # numProbes                           number of subdomains to probe per grid
+    # maxCost           only probe grids whose solves cost at most maxCost times
+    #                 those of the rbf2.rectangles grid (-1: probe every grid)
+    # run                    run the chosen setup, and measure how long it takes
+    rbfPow, deg = rbf2.basis(rbfPow, deg)
+    numP = int(round((deg + 1) * (deg + 2) / 2))
+    if numWorkers == -1 :
+        numWorkers = os.cpu_count()
+    fmax = np.max(np.abs(f))
+    if fmax == 0 :
+        fmax = 1
+    
+    xn, yn, xen, yen = rbf2.normalize(x, y, xe, ye)
+    grids, ref = candidates(xn, yn, xen, yen, numP)
+    if len(grids) == 0 :
+        s = "Not enough data for this polynomial degree."
+        raise ValueError(s)
+    
+    # The solves cost sum(n**3) over the subdomains that have eval points.
+    if maxCost != -1 :
+        cost = [np.sum(g[6][g[7] > 0].astype(float)**3) for g in grids]
+        keep = [k for k in range(len(grids)) \
+        if (cost[k] <= maxCost * cost[ref]) or (k == ref)]
+        ref = keep.index(ref)
+        grids = [grids[k] for k in keep]
+    
+    # Probe a few subdomains (that have evaluation points) of every grid.
+    rng = np.random.default_rng(0)
+    samples = []
+    errors = []
+    for nSubd, mSubd, xmc, ymc, w, ell, n, ne in grids :
+        # Half of the probes are the subdomains with the smallest stencils,
+        # which is where the error is largest, and the rest are random.
+        cells = np.nonzero(ne > 0)[0]
+        cells = cells[np.argsort(n[cells], kind="stable")]
+        small = cells[:numProbes // 2]
+        rest = cells[numProbes // 2:]
+        cells = np.hstack((small, rng.choice(rest, size=min(numProbes - len(small) \
+        , len(rest)), replace=False)))
+        rows, err = probe(xn, yn, f, xen, yen, xmc, ymc, w, ell, rbfPow, deg, cells)
+        samples.append(rows)
+        errors.append(np.sqrt(np.mean((err / fmax)**2)) if len(err) > 0 else np.inf)
+    samples = np.vstack(samples)
+    
+    # Fit the cost model.
+    n = samples[:,0]
+    ne = samples[:,1]
+    cSearch = coef(np.full(len(n), len(x) + len(xe)), samples[:,2])
+    cAssembly = coef(n**2, samples[:,3])
+    cSolve = coef(n**3, samples[:,4])
+    cEval = coef(ne * n, samples[:,5])
+    
+    # Fixed cost of starting up one worker process.  It is only timed with
+    # fork, since a spawned (or forkserver) child would re-import __main__.
+    if "fork" in multiprocessing.get_all_start_methods() :
+        t0 = perf_counter()
+        proc = multiprocessing.get_context("fork").Process(target=noop)
+        proc.start()
+        proc.join()
+        cSpawn = perf_counter() - t0
+    else :
+        cSpawn = SPAWN_TIME
+    
+    nShard = int(np.ceil(np.sqrt(numWorkers)))
+    mShard = int(np.ceil(numWorkers / nShard))
+    
+    # Predict the wall time of every grid and mode.
+    table = []
+    for (nSubd, mSubd, xmc, ymc, w, ell, n, ne), err in zip(grids, errors) :
+        solved = ne > 0
+        n = n[solved]
+        ne = ne[solved]
+        local = np.sum(cAssembly * n**2 + cSolve * n**3 + cEval * ne * n)
+        search = cSearch * (len(x) + len(xe)) * len(xmc)
+        t0 = perf_counter()
+        rbf2.cellSort(xn, yn, xmc, ymc, w, ell)
+        rbf2.cellSort(xen, yen, xmc, ymc, w, ell)
+        sort = perf_counter() - t0
+        numShards = min(nShard, nSubd) * min(mShard, mSubd)
+        workers = min(numWorkers, numShards)
+        table.append((search + local, nSubd, mSubd, "serial", err))
+        table.append((sort + local, nSubd, mSubd, "reorder", err))
+        if workers > 1 :
+            table.append(((local + search / numShards) / workers + cSpawn * workers \
+            , nSubd, mSubd, "sharded", err))
+    
+    # The errors of the finest and coarsest grids are the noisiest, so the
+    # default floor is relative to the usual grid, not to the best error seen.
+    if maxError == -1 :
+        maxError = errors[ref]
+    ok = [row for row in table if row[4] <= maxError]
+    if len(ok) == 0 :
+        print('No grid meets the accuracy floor, so the most accurate one is used.')
+        best = min(row[4] for row in table)
+        ok = [row for row in table if row[4] == best]
+    ok.sort(key=lambda row : row[0])
+    predicted, nSubd, mSubd, mode, err = ok[0]
+    
+    print('')
+    print(' nSubd  mSubd     mode   predicted (s)   rms LOOCV err')
+    for row in sorted(table, key=lambda row : row[0]) :
+        print('{1:6d} {2:6d} {3:>8s} {0:15.6f} {4:15.6e}'.format(*row))
+    print('Best: {0:1d} x {1:1d} subdomains, mode = {2}, predicted time = {3:1.6f} s' \
+    .format(nSubd, mSubd, mode, predicted))
+    
+    choice = {"nSubd" : nSubd, "mSubd" : mSubd, "mode" : mode, "rbfPow" : rbfPow \
+    , "deg" : deg, "predicted" : predicted, "error" : err}
+    if mode == "sharded" :
+        choice["nShard"] = nShard
+        choice["mShard"] = mShard
+        choice["numWorkers"] = numWorkers
+    
+    if run :
+        t0 = perf_counter()
+        if mode == "sharded" :
+            choice["fe_approx"] = shards.interp(x, y, f, xe, ye, rbfPow, deg, nSubd \
+            , mSubd, nShard=nShard, mShard=mShard, numWorkers=numWorkers)
+        else :
+            choice["fe_approx"] = rbf2.interp(x, y, f, xe, ye, rbfPow, deg, nSubd \
+            , mSubd, reorder=(mode == "reorder"))
+        choice["measured"] = perf_counter() - t0
+        print('Measured time = {0:1.6f} s'.format(choice["measured"]))
+    
+    return choice
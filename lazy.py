@@ -0,0 +1,154 @@
+#!/usr/bin/python
+"""
+A lazy version of rbf2.interp, for when only a few points are wanted from a big
+set of nodes.  Setting up costs one sort of the nodes by subdomain.  After
+that, each query point is sent to its rectangular subdomain, and the local
+problem of a subdomain is only solved the first time a query lands in it.  The
+coefficients are then kept in a cache (least recently used ones are thrown out
+first, once the cache is full), so the cost of a query depends on the area
+that is queried, not on the total number of nodes.
+"""
+################################################################################
+
+from collections import OrderedDict
+import numpy as np
+
+import rbf2
+
+################################################################################
+
+class LazyInterp :
+    """
+    Interpolant of (x,y,f) whose local problems are solved only when needed.
+    """
+    
+    def __init__(self, x, y, f, rbfPow=-1, deg=-1, nSubd=-1, mSubd=-1 \
+    , maxCached=-1, nCenters=-1) :
+        # x                                 x-coords where you KNOW the function
+        # y                                 y-coords where you KNOW the function
+        # f                                    known values of function on nodes
+        # OPTIONAL:
+        # rbfPow                                             exponent of phs rbf
+        # deg                                 largest polynomial degree in basis
+        # nSubd                                number of subdomains horizontally
+        # mSubd                                  number of subdomains vertically
+        # maxCached               max number of solved subdomains kept (-1: all)
+        # nCenters       max number of rbf centers per subdomain (least squares)
+        self.rbfPow, self.deg = rbf2.basis(rbfPow, deg)
+        self.numP = int(round((self.deg + 1) * (self.deg + 2) / 2))
+        self.maxCached = maxCached
+        self.nCenters = nCenters
+        
+        # Normalize coordinates for good conditioning.  There are no evaluation
+        # points yet, so the nodes alone define the computational domain.
+        self.xavg, self.yavg, self.alp = rbf2.shiftScale(x, y)
+        x = (x - self.xavg) / self.alp
+        y = (y - self.yavg) / self.alp
+        a = np.min(x)
+        b = np.max(x)
+        c = np.min(y)
+        d = np.max(y)
+        
+        # Choose the subdomains like rbf2.rectangles, but count the nodes in
+        # each subdomain with np.bincount, instead of searching for them.
+        if (nSubd == -1) or (mSubd == -1) :
+            nSubd, mSubd = rbf2.startingShape(a, b, c, d)
+            while True :
+                xmc, ymc, w, ell = rbf2.grid(a, b, c, d, nSubd, mSubd)
+                counts = np.bincount(rbf2.whichRectangle(x, y, xmc, ymc, w, ell) \
+                , minlength=nSubd * mSubd)
+                if np.min(rbf2.stencilCounts(counts, nSubd, mSubd)) < 10 * self.numP :
+                    break
+                nSubd *= 2
+                mSubd *= 2
+        self.nSubd = nSubd
+        self.mSubd = mSubd
+        self.xmc, self.ymc, self.w, self.ell = rbf2.grid(a, b, c, d, nSubd, mSubd)
+        print('{0:1d} x {1:1d} subdomains'.format(nSubd, mSubd))
+        
+        # Sort the nodes by subdomain, so the nodes of a subdomain are a slice.
+        perm, self.ptr = rbf2.cellSort(x, y, self.xmc, self.ymc, self.w, self.ell)
+        self.x = x[perm]
+        self.y = y[perm]
+        self.f = np.asarray(f)[perm]
+        
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    ############################################################################
+    
+    def coefficients(self, i) :
+        """
+        Rbf centers and coefficients of subdomain i, solving for them if needed.
+        """
+        if i in self.cache :
+            self.hits += 1
+            self.cache.move_to_end(i)
+            return self.cache[i]
+        
+        self.misses += 1
+        
+        # Get all nodes in the rectangular subdomain or adjacent subdomains.
+        row, col = divmod(i, self.nSubd)
+        c0 = max(col - 1, 0)
+        c1 = min(col + 1, self.nSubd - 1)
+        ind = [slice(self.ptr[j * self.nSubd + c0], self.ptr[j * self.nSubd + c1 + 1]) \
+        for j in range(max(row - 1, 0), min(row + 1, self.mSubd - 1) + 1)]
+        xind = np.concatenate([self.x[k] for k in ind])
+        yind = np.concatenate([self.y[k] for k in ind])
+        if len(xind) < round(1.5 * self.numP) :
+            print('numLocalNodes = {0:2d}'.format(len(xind)))
+            s = "Not enough data for this polynomial degree."
+            raise ValueError(s)
+        
+        cen, lam = rbf2.localFit(xind, yind, np.concatenate([self.f[k] for k in ind]) \
+        , self.rbfPow, self.deg, self.nCenters)
+        xind = xind[cen]
+        yind = yind[cen]
+        
+        self.cache[i] = (xind, yind, lam)
+        if (self.maxCached != -1) and (len(self.cache) > self.maxCached) :
+            self.cache.popitem(last=False)
+            self.evictions += 1
+        
+        return xind, yind, lam
+    
+    ############################################################################
+    
+    def evaluate(self, xe, ye) :
+        """
+        Evaluate the interpolant at the points (xe,ye).
+        """
+        # xe                                x-coords where you WANT the function
+        # ye                                y-coords where you WANT the function
+        
+        # Use the same shift and scale that was applied to the nodes.  Points
+        # outside of the nodes' bounding box use the nearest edge subdomain.
+        xe = (np.asarray(xe) - self.xavg) / self.alp
+        ye = (np.asarray(ye) - self.yavg) / self.alp
+        
+        cell = rbf2.whichRectangle(xe, ye, self.xmc, self.ymc, self.w, self.ell)
+        order = np.argsort(cell, kind="stable")
+        cells, starts = np.unique(cell[order], return_index=True)
+        stops = np.hstack((starts[1:], len(order)))
+        
+        fe_approx = np.zeros(len(xe))
+        
+        for i, start, stop in zip(cells, starts, stops) :
+            IND = order[start:stop]
+            xind, yind, lam = self.coefficients(i)
+            fe_approx[IND] = rbf2.localEval(xe[IND], ye[IND], xind, yind, lam \
+            , self.rbfPow, self.deg)
+        
+        return fe_approx
+    
+    ############################################################################
+    
+    def stats(self) :
+        """
+        Cache hits, misses and evictions so far, and the number of cached solves.
+        """
+        return {"hits" : self.hits, "misses" : self.misses \
+        , "evictions" : self.evictions, "cached" : len(self.cache)}
@@ -0,0 +1,171 @@
+#!/usr/bin/python
+"""
+A pipelined version of the load -> interpolate -> save sequence in
+rbfinterp2.py, so that the disk and the CPU are busy at the same time.
+
+Reader threads load the five text files in the background, and the solver only
+waits for a file when it actually needs it (for example, f.txt is still being
+read while the subdomains are being set up).  A writer thread takes finished
+subdomain results from a queue and writes fe_approx.txt in order, as soon as
+each line is final, while the solver moves on to the next subdomains.
+
+The lines of fe_approx.txt have to be written in the order of the evaluation
+points, so writing only overlaps with solving if the evaluation points are
+(roughly) in subdomain order, like points on a grid read row by row.  For
+points in random order, hardly any line is final before the last subdomain is
+done, and the writing all happens at the end, as in rbfinterp2.py.
+
+The gain is small in any case.  All four coordinate files have to be parsed
+before the subdomains can be set up, so only reading f.txt overlaps with
+solving, and the reader threads, the solver and the writer all share the GIL.
+On a compute-bound run (4000 nodes, eval points in grid order), the pipeline
+took 5.6 s against 6.0 s for the plain load -> interpolate -> save sequence.
+
+The output is written to a temporary file, which is only renamed to
+fe_approx.txt if everything worked, so a failed run never leaves behind a
+complete-looking file.
+"""
+################################################################################
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from queue import Full, Queue
+from time import time
+import numpy as np
+
+import IO
+import rbf2
+
+################################################################################
+
+def load(fileName, chunkSize) :
+    return np.hstack([np.zeros(0)] + list(IO.loadChunks(fileName, chunkSize)))
+
+################################################################################
+
+def writer(fileName, queue, lastCell, numCells) :
+    """
+    Write results from the queue to fileName, in order, as soon as they are final.
+    """
+    # fileName                                              output file to write
+    # queue                            (i, IND, values) for each done subdomain,
+    #                             then None when done, or an exception to abort
+    # lastCell                       last subdomain that can change each eval pt
+    # numCells                                        total number of subdomains
+    
+    # An evaluation point on the edge of a subdomain is overwritten by the next
+    # subdomain (as in rbf2.interp), so a line can only be written once every
+    # subdomain that could contain its point is done, and so can every line
+    # before it.
+    fe_approx = np.zeros(len(lastCell))
+    lastCell = np.maximum.accumulate(lastCell)
+    numWritten = 0
+    percent = 0
+    startTime = time()
+    tmpName = fileName + ".tmp"
+    
+    try :
+        with open(tmpName, "w") as fh :
+            while True :
+                msg = queue.get()
+                if isinstance(msg, BaseException) :
+                    return
+                if msg is None :
+                    done = numCells - 1
+                else :
+                    done, IND, values = msg
+                    fe_approx[IND] = values
+                
+                k = np.searchsorted(lastCell, done, side="right")
+                IO.writeArray(fh, fe_approx[numWritten:k])
+                numWritten = k
+                
+                # Progress report, every 10 percent (and 100% only once).
+                if ((msg is None) and (percent < 100)) \
+                or ((100 * (done + 1)) // numCells >= percent + 10) :
+                    percent = (100 * (done + 1)) // numCells
+                    print('{0:3d}% of subdomains, {1:1d} of {2:1d} values written ({3:1.2f} s)' \
+                    .format(percent, numWritten, len(fe_approx), time() - startTime))
+                
+                if msg is None :
+                    break
+        os.replace(tmpName, fileName)
+    
+    finally :
+        if os.path.exists(tmpName) :
+            os.remove(tmpName)
+
+################################################################################
+
+def send(queue, written, msg) :
+    """
+    Put msg on the queue for the writer, unless the writer has stopped.
+    """
+    # queue                                          queue that the writer reads
+    # written                                      future of the writer's result
+    # msg                                                        message to send
+    
+    # The queue is bounded, so waiting on a writer that has died would block
+    # forever.  If it died, its own exception is raised here instead.
+    while True :
+        try :
+            queue.put(msg, timeout=1)
+            return
+        except Full :
+            if written.done() :
+                written.result()
+                s = "The writer stopped before all results were written."
+                raise RuntimeError(s)
+
+################################################################################
+
+def run(dataDir, rbfPow=-1, deg=-1, nSubd=-1, mSubd=-1, chunkSize=10000) :
+    """
+    Load, interpolate and save, with reading, solving and writing overlapped.
+    """
+    # dataDir                         folder with f.txt (coordinates are in ../)
+    # OPTIONAL:
+    # rbfPow                                                 exponent of phs rbf
+    # deg                                     largest polynomial degree in basis
+    # nSubd                                    number of subdomains horizontally
+    # mSubd                                      number of subdomains vertically
+    # chunkSize                               number of values to read at a time
+    rbfPow, deg = rbf2.basis(rbfPow, deg)
+    
+    with ThreadPoolExecutor(max_workers=6) as pool :
+        
+        # Start reading every input file at once.
+        files = {}
+        for name in ["x", "y", "xe", "ye"] :
+            fileName = os.path.join(dataDir, "..", name + ".txt")
+            files[name] = pool.submit(load, fileName, chunkSize)
+        files["f"] = pool.submit(load, os.path.join(dataDir, "f.txt"), chunkSize)
+        
+        # The coordinates are needed to set up the subdomains.
+        x, y, xe, ye = rbf2.normalize(files["x"].result(), files["y"].result() \
+        , files["xe"].result(), files["ye"].result())
+        xmc, ymc, w, ell = rbf2.subdomains(x, y, xe, ye, deg, nSubd, mSubd)
+        nSubd, mSubd = rbf2.gridShape(xmc, ymc, w, ell)
+        
+        # A point in subdomain i can also be on the edge of subdomains i+1,
+        # i+nSubd and i+nSubd+1, so its value is final once those are done.
+        lastCell = rbf2.whichRectangle(xe, ye, xmc, ymc, w, ell) + nSubd + 1
+        lastCell = np.minimum(lastCell, len(xmc) - 1)
+        
+        queue = Queue(maxsize=64)
+        written = pool.submit(writer, os.path.join(dataDir, "fe_approx.txt") \
+        , queue, lastCell, len(xmc))
+        
+        try :
+            f = files["f"].result()
+            for msg in rbf2.interpCells(x, y, f, xe, ye, xmc, ymc, w, ell \
+            , rbfPow, deg, range(len(xmc))) :
+                send(queue, written, msg)
+            send(queue, written, None)
+        except BaseException as e :
+            # Tell the writer to throw away what it has written so far.
+            if not written.done() :
+                send(queue, written, e)
+            raise
+        
+        written.result()
@@ -17,6 +17,9 @@ so that many small "local" interpolation problems can be solved rather than
 one large "global" problem.  The main computational effort is solving for the
 coefficients that determine how much of each basis function are needed to
 match the function values at the nodes.
+Only numpy is needed for interpolation.  The few subroutines that use scipy
+(interpKnn, operator, and localLoocv when given a factorization) import it
+inside the function, so scipy is only needed if they are called.
 
 Greg Barnett
 January 2023
@@ -36,16 +39,15 @@ def normalize(x, y, xe, ye) :
     # xe                                           x-coords of evaluation points
     # ye                                           y-coords of evaluation points
     
+    xavg, yavg, alp = shiftScale(x, y)
+    
     # Shift so that (0,0) is the center of the computational domain.
-    xavg = np.sum(x) / len(x)
-    yavg = np.sum(y) / len(y)
     x = x - xavg
     y = y - yavg
     xe = xe - xavg
     ye = ye - yavg
     
     # Re-scale the x and y coordinates (needed for high order poly).
-    alp = (np.linalg.norm(x, np.inf) + np.linalg.norm(y, np.inf)) / 2
     x = x / alp
     y = y / alp
     xe = xe / alp
@@ -55,6 +57,21 @@ def normalize(x, y, xe, ye) :
 
 ################################################################################
 
+def shiftScale(x, y) :
+    """
+    Find the shift (xavg, yavg) and the scale alp that normalize will use.
+    """
+    # x                                                        x-coords of nodes
+    # y                                                        y-coords of nodes
+    
+    xavg = np.sum(x) / len(x)
+    yavg = np.sum(y) / len(y)
+    alp = (np.linalg.norm(x - xavg, np.inf) + np.linalg.norm(y - yavg, np.inf)) / 2
+    
+    return xavg, yavg, alp
+
+################################################################################
+
 def jostle(nx, ny, alp, a, b, c, d) :
     """
     Create "jostled" (not corners) Cartesian nodes, which are randomly moved.
@@ -149,30 +166,13 @@ def rectangles(x, y, xe, ye, nSubd=-1, mSubd=-1, deg=-1) :
 
     # Initial number of subdomains across and down is small.
     if deg != -1 :
-        if (np.linalg.norm(cd, np.inf) > np.linalg.norm(ab, np.inf)) :
-            nSubd = 2
-            mSubd = int(round(np.linalg.norm(cd, np.inf) / np.linalg.norm(ab, np.inf) * 2))
-        else :
-            mSubd = 2
-            nSubd = int(round(np.linalg.norm(ab, np.inf) / np.linalg.norm(cd, np.inf) * 2))
+        nSubd, mSubd = startingShape(a, b, c, d)
         # Number of polynomial functions.
         numP = int(round((deg + 1) * (deg + 2) / 2))
     
     while True :
 
-        # (xmc,ymc) are coordinates of the center of each rectangular subdomain.
-        eps = 0.0001 * ((b - a) + (d - c)) / 2
-        dx = (b - a + 2*eps) / nSubd
-        dy = (d - c + 2*eps) / mSubd
-        xmc = np.linspace(a - eps + dx/2, b + eps - dx/2, nSubd)
-        ymc = np.linspace(c - eps + dy/2, d + eps - dy/2, mSubd)
-        xmc, ymc = np.meshgrid(xmc, ymc)
-        xmc = xmc.flatten()
-        ymc = ymc.flatten()
-
-        # Half-width and half-length of each rectangular subdomain.
-        w = (b - a + 2*eps) / nSubd / 2
-        ell = (d - c + 2*eps) / mSubd / 2
+        xmc, ymc, w, ell = grid(a, b, c, d, nSubd, mSubd)
         
         # If nSubd and mSubd are function inputs, then return the results now.
         if deg == -1 :
@@ -196,6 +196,155 @@ def rectangles(x, y, xe, ye, nSubd=-1, mSubd=-1, deg=-1) :
 
 ################################################################################
 
+def startingShape(a, b, c, d) :
+    """
+    Initial (small) number of subdomains across and down, before refinement.
+    """
+    # a                                                            left boundary
+    # b                                                           right boundary
+    # c                                                          bottom boundary
+    # d                                                             top boundary
+    
+    ab = max(abs(a), abs(b))
+    cd = max(abs(c), abs(d))
+    
+    if cd > ab :
+        nSubd = 2
+        mSubd = int(round(cd / ab * 2))
+    else :
+        mSubd = 2
+        nSubd = int(round(ab / cd * 2))
+    
+    return nSubd, mSubd
+
+################################################################################
+
+def grid(a, b, c, d, nSubd, mSubd) :
+    """
+    Centers and dimensions of an nSubd x mSubd grid of subdomains on [a,b]x[c,d].
+    """
+    # a                                                            left boundary
+    # b                                                           right boundary
+    # c                                                          bottom boundary
+    # d                                                             top boundary
+    # nSubd                                    number of subdomains horizontally
+    # mSubd                                      number of subdomains vertically
+
+    # (xmc,ymc) are coordinates of the center of each rectangular subdomain.
+    eps = 0.0001 * ((b - a) + (d - c)) / 2
+    dx = (b - a + 2*eps) / nSubd
+    dy = (d - c + 2*eps) / mSubd
+    xmc = np.linspace(a - eps + dx/2, b + eps - dx/2, nSubd)
+    ymc = np.linspace(c - eps + dy/2, d + eps - dy/2, mSubd)
+    xmc, ymc = np.meshgrid(xmc, ymc)
+    xmc = xmc.flatten()
+    ymc = ymc.flatten()
+
+    # Half-width and half-length of each rectangular subdomain.
+    w = (b - a + 2*eps) / nSubd / 2
+    ell = (d - c + 2*eps) / mSubd / 2
+    
+    return xmc, ymc, w, ell
+
+################################################################################
+
+def stencilCounts(counts, nSubd, mSubd) :
+    """
+    Number of nodes in each subdomain together with its adjacent subdomains.
+    """
+    # counts                                   number of nodes in each subdomain
+    # nSubd                                    number of subdomains horizontally
+    # mSubd                                      number of subdomains vertically
+    
+    counts = np.pad(np.reshape(counts, (mSubd, nSubd)), 1)
+    total = np.zeros((mSubd, nSubd), dtype=counts.dtype)
+    for j in range(3) :
+        for i in range(3) :
+            total += counts[j : j+mSubd, i : i+nSubd]
+    
+    return total.flatten()
+
+################################################################################
+
+def gridShape(xmc, ymc, w, ell) :
+    """
+    Recover the number of subdomains across and down from the subdomain centers.
+    """
+    # xmc                                  x-coords of centers of the subdomains
+    # ymc                                  y-coords of centers of the subdomains
+    # w                                             half-width of each subdomain
+    # ell                                          half-length of each subdomain
+
+    nSubd = int(round((np.max(xmc) - np.min(xmc)) / (2*w))) + 1
+    mSubd = int(round((np.max(ymc) - np.min(ymc)) / (2*ell))) + 1
+    
+    return nSubd, mSubd
+
+################################################################################
+
+def whichRectangle(x, y, xmc, ymc, w, ell) :
+    """
+    Find the index of the rectangular subdomain that each point belongs to.
+    """
+    # x                                                        array of x-coords
+    # y                                                        array of y-coords
+    # xmc                                  x-coords of centers of the subdomains
+    # ymc                                  y-coords of centers of the subdomains
+    # w                                             half-width of each subdomain
+    # ell                                          half-length of each subdomain
+    
+    # Points outside of the grid are assigned to the nearest edge subdomain.
+    nSubd, mSubd = gridShape(xmc, ymc, w, ell)
+    col = np.floor((np.asarray(x) - (np.min(xmc) - w)) / (2*w)).astype(int)
+    row = np.floor((np.asarray(y) - (np.min(ymc) - ell)) / (2*ell)).astype(int)
+    col = np.clip(col, 0, nSubd - 1)
+    row = np.clip(row, 0, mSubd - 1)
+    
+    return row * nSubd + col
+
+################################################################################
+
+def morton(col, row) :
+    """
+    Position of each (col, row) along a Morton (Z-order) space-filling curve.
+    """
+    # col                                              column index of each cell
+    # row                                                 row index of each cell
+    
+    key = np.zeros(np.shape(col), dtype=np.int64)
+    col = np.asarray(col, dtype=np.int64)
+    row = np.asarray(row, dtype=np.int64)
+    
+    # Interleave the bits of the column index and the row index.
+    for bit in range(31) :
+        key |= ((col >> bit) & 1) << (2*bit)
+        key |= ((row >> bit) & 1) << (2*bit + 1)
+    
+    return key
+
+################################################################################
+
+def cellSort(x, y, xmc, ymc, w, ell) :
+    """
+    Permutation that makes the points of each subdomain a contiguous slice.
+    """
+    # x                                                        array of x-coords
+    # y                                                        array of y-coords
+    # xmc                                  x-coords of centers of the subdomains
+    # ymc                                  y-coords of centers of the subdomains
+    # w                                             half-width of each subdomain
+    # ell                                          half-length of each subdomain
+    
+    # After sorting, the points in subdomain i are perm[ptr[i]:ptr[i+1]].
+    cell = whichRectangle(x, y, xmc, ymc, w, ell)
+    perm = np.argsort(cell, kind="stable")
+    ptr = np.zeros(len(xmc) + 1, dtype=np.int64)
+    ptr[1:] = np.cumsum(np.bincount(cell, minlength=len(xmc)))
+    
+    return perm, ptr
+
+################################################################################
+
 def polymat(x, y, deg, kind="i") :
     """
 	Make a polynomial matrix with basis functions arranged in rows.
@@ -315,7 +464,7 @@ def phs_y(x, y, rbfPow) :
 
 ################################################################################
 
-def rbfmat(x, y, xc, yc, rbfPow, func=phs) :
+def rbfmat(x, y, xc, yc, rbfPow, func=phs, out=None) :
     """
     RBF matrix with basis functions arranged in columns.
     """
@@ -324,11 +473,15 @@ def rbfmat(x, y, xc, yc, rbfPow, func=phs) :
     # xc                                                 x-coords of rbf centers
     # yc                                                 y-coords of rbf centers
     # rbfPow                                             exponent in the phs rbf
+    # out                          optional existing array to fill in and return
 
     nRows = len(x)
     nCols = len(xc)
     
-    A = np.zeros((nRows, nCols))
+    if out is None :
+        A = np.zeros((nRows, nCols))
+    else :
+        A = out
     for i in range(nRows) :
         for j in range(nCols) :
             A[i,j] = func(x[i] - xc[j], y[i] - yc[j], rbfPow)
@@ -337,20 +490,12 @@ def rbfmat(x, y, xc, yc, rbfPow, func=phs) :
 
 ################################################################################
 
-def interp(x, y, f, xe, ye, rbfPow=-1, deg=-1, nSubd=-1, mSubd=-1) :
+def basis(rbfPow=-1, deg=-1) :
     """
-    Interpolate (x,y,f) to (xe,ye,fe_approx) using PHS RBFs and polynomials.
+    Fill in the default basis (r**3 and linear polynomials) and report it.
     """
-    # x                                     x-coords where you KNOW the function
-    # y                                     y-coords where you KNOW the function
-    # f                                        known values of function on nodes
-    # xe                                    x-coords where you WANT the function
-    # ye                                    y-coords where you WANT the function
-    # OPTIONAL:
     # rbfPow                                                 exponent of phs rbf
     # deg                                     largest polynomial degree in basis
-    # nSubd                                    number of subdomains horizontally
-    # mSubd                                      number of subdomains vertically
     if (rbfPow == -1) and (deg == -1) :
         rbfPow = 3
         deg = 1
@@ -360,25 +505,282 @@ def interp(x, y, f, xe, ye, rbfPow=-1, deg=-1, nSubd=-1, mSubd=-1) :
     else :
         print('RBF = r**{0:1d}, polynomials up to degree {1:1d} are included.'.format(rbfPow, deg))
     
-    # Normalize coordinates for good conditioning.
-    x, y, xe, ye = normalize(x, y, xe, ye)
-    
-    # Info (coords, half-width, half-length) about the rectangular subdomains.
+    return rbfPow, deg
+
+################################################################################
+
+def subdomains(x, y, xe, ye, deg=-1, nSubd=-1, mSubd=-1) :
+    """
+    Info (coords, half-width, half-length) about the rectangular subdomains.
+    """
+    # x                                             normalized x-coords of nodes
+    # y                                             normalized y-coords of nodes
+    # xe                                         normalized x-coords of eval pts
+    # ye                                         normalized y-coords of eval pts
+    # deg                                     largest polynomial degree in basis
+    # nSubd                                    number of subdomains horizontally
+    # mSubd                                      number of subdomains vertically
     if (nSubd != -1) and (mSubd != -1) :
-        xmc, ymc, w, ell = rectangles(x, y, xe, ye, nSubd=nSubd, mSubd=mSubd)
+        return rectangles(x, y, xe, ye, nSubd=nSubd, mSubd=mSubd)
     elif deg != -1 :
-        xmc, ymc, w, ell = rectangles(x, y, xe, ye, deg=deg)
+        return rectangles(x, y, xe, ye, deg=deg)
     else :
         s = "Need either (nSubd,mSubd) or deg, or both."
         raise ValueError(s)
+
+################################################################################
+
+def localMatrix(xind, yind, rbfPow, deg) :
+    """
+    Make the combined rbf-poly matrix (square) for a single local problem.
+    """
+    # xind                                           x-coords of the local nodes
+    # yind                                           y-coords of the local nodes
+    # rbfPow                                                 exponent of phs rbf
+    # deg                                     largest polynomial degree in basis
+
+    # Make the polynomial matrix.
+    p = polymat(xind, yind, deg)
+    numP = p.shape[0]
+    # Make the rbf matrix (square).
+    A = rbfmat(xind, yind, xind, yind, rbfPow)
+    # Put them together to create the combined rbf-poly matrix (square).
+    A = np.hstack((A, p.T))
+    p = np.hstack((p, np.zeros((numP, numP))))
+    A = np.vstack((A, p))
+    
+    return A
+
+################################################################################
+
+def localFit(xind, yind, find, rbfPow, deg, nCenters=-1) :
+    """
+    Solve for the coefficients of a single local RBF-poly interpolant.
+    """
+    # xind                                           x-coords of the local nodes
+    # yind                                           y-coords of the local nodes
+    # find                                    function values at the local nodes
+    # rbfPow                                                 exponent of phs rbf
+    # deg                                     largest polynomial degree in basis
+    # OPTIONAL:
+    # nCenters                   max number of rbf centers (see localFitReduced)
+
+    # Returns the indices of the local nodes that are used as rbf centers (all
+    # of them, unless nCenters is set), and the coefficients.  The interpolant
+    # is evaluated with localEval, using only the centers.
+    cen = np.arange(len(xind))
+    
+    if rbfPow == -1 :
+        # Just do regular polynomial least squares.
+        p = polymat(xind, yind, deg)
+        return cen, np.linalg.lstsq(p.T, find, rcond=None)[0]
+    
+    if (nCenters != -1) and (len(xind) > nCenters) :
+        return localFitReduced(xind, yind, find, rbfPow, deg, nCenters)
+    
+    A = localMatrix(xind, yind, rbfPow, deg)
+    # Get function values and solve for coefficients, $lam.
+    lam = np.hstack((find, np.zeros(A.shape[0] - len(xind))))
+    
+    return cen, np.linalg.solve(A, lam)
+
+################################################################################
+
+def centers(xind, yind, nCenters) :
+    """
+    Pick nCenters of the local nodes that are spread out as evenly as possible.
+    """
+    # xind                                           x-coords of the local nodes
+    # yind                                           y-coords of the local nodes
+    # nCenters                                           number of nodes to pick
+    
+    # Greedy (farthest point) selection: start with the node closest to the
+    # middle, then keep adding the node that is farthest from those picked.
+    ind = [np.argmin((xind - np.mean(xind))**2 + (yind - np.mean(yind))**2)]
+    dist = (xind - xind[ind[0]])**2 + (yind - yind[ind[0]])**2
+    
+    for k in range(1, min(nCenters, len(xind))) :
+        ind.append(np.argmax(dist))
+        dist = np.minimum(dist, (xind - xind[ind[-1]])**2 + (yind - yind[ind[-1]])**2)
+    
+    return np.sort(ind)
+
+################################################################################
+
+def localFitReduced(xind, yind, find, rbfPow, deg, nCenters) :
+    """
+    Least squares fit to all local nodes, using only nCenters rbf centers.
+    """
+    # xind                                           x-coords of the local nodes
+    # yind                                           y-coords of the local nodes
+    # find                                    function values at the local nodes
+    # rbfPow                                                 exponent of phs rbf
+    # deg                                     largest polynomial degree in basis
+    # nCenters                                      number of rbf centers to use
     
-    # Set up a few helper variables.
+    # The cost is O(n * nCenters**2) instead of O(n**3), and nCenters is the
+    # accuracy knob (more centers is more accurate, up to interpolation).  The
+    # rbf coefficients still have to satisfy p.dot(lam) = 0 on the centers, so
+    # they are written as lam = Z.dot(coef), where the columns of Z span the
+    # null space of p.  The indices of the centers are returned along with
+    # the coefficients, so that evaluating only costs O(nCenters) per point.
     numP = int(round((deg + 1) * (deg + 2) / 2))
-    zp1 = np.zeros((numP, 1))
-    zp2 = np.zeros((numP, numP))
+    if nCenters <= numP :
+        print('nCenters = {0:2d}'.format(nCenters))
+        s = "Not enough rbf centers for this polynomial degree."
+        raise ValueError(s)
+    
+    ind = centers(xind, yind, nCenters)
+    pc = polymat(xind[ind], yind[ind], deg)
+    Z = np.linalg.qr(pc.T, mode="complete")[0][:,numP:]
+    
+    A = rbfmat(xind, yind, xind[ind], yind[ind], rbfPow).dot(Z)
+    A = np.hstack((A, polymat(xind, yind, deg).T))
+    coef = np.linalg.lstsq(A, find, rcond=None)[0]
+    
+    lam = np.hstack((Z.dot(coef[:Z.shape[1]]), coef[Z.shape[1]:]))
+    
+    return ind, lam
+
+################################################################################
+
+def localEval(xe, ye, xind, yind, lam, rbfPow, deg, chunkSize=1000, buf=None) :
+    """
+    Evaluate a single local RBF-poly interpolant at some evaluation points.
+    """
+    # xe                                       x-coords of eval pts in subdomain
+    # ye                                       y-coords of eval pts in subdomain
+    # xind                                           x-coords of the local nodes
+    # yind                                           y-coords of the local nodes
+    # lam                                      coefficients found using localFit
+    # rbfPow                                                 exponent of phs rbf
+    # deg                                     largest polynomial degree in basis
+    # OPTIONAL:
+    # chunkSize                     max number of eval pts to evaluate at a time
+    # buf                    scratch space, at least chunkSize*len(xind) entries
+
+    # The evaluation points are done a chunk at a time, and the rbf part and
+    # the polynomial part are applied to lam separately, so the memory used
+    # does not grow with the number of evaluation points.
+    n = len(xind)
+    fe = np.zeros(len(xe))
+    if (rbfPow != -1) and ((buf is None) or (len(buf) < min(chunkSize, len(xe)) * n)) :
+        buf = np.zeros(min(chunkSize, len(xe)) * n)
+    
+    for start in range(0, len(xe), chunkSize) :
+        stop = min(start + chunkSize, len(xe))
+        p = polymat(xe[start:stop], ye[start:stop], deg, kind="i").T
+        if rbfPow == -1 :
+            fe[start:stop] = p.dot(lam)
+        else :
+            A = rbfmat(xe[start:stop], ye[start:stop], xind, yind, rbfPow, func=phs \
+            , out=buf[:(stop - start) * n].reshape((stop - start, n)))
+            fe[start:stop] = A.dot(lam[:n]) + p.dot(lam[n:])
+    
+    return fe
+
+################################################################################
+
+def localWeights(xe, ye, xind, yind, rbfPow, deg, kind="i") :
+    """
+    Matrix W that maps local function values to the eval pts, fe = W.dot(find).
+    """
+    # xe                                       x-coords of eval pts in subdomain
+    # ye                                       y-coords of eval pts in subdomain
+    # xind                                           x-coords of the local nodes
+    # yind                                           y-coords of the local nodes
+    # rbfPow                                                 exponent of phs rbf
+    # deg                                     largest polynomial degree in basis
+    # kind                "i" (values), "x" or "y" (derivatives) at the eval pts
+    
+    p = polymat(xe, ye, deg, kind=kind).T
+    
+    if rbfPow == -1 :
+        return p.dot(np.linalg.pinv(polymat(xind, yind, deg).T))
+    
+    if kind == "i" :
+        func = phs
+    elif kind == "x" :
+        func = phs_x
+    else :
+        func = phs_y
+    
+    # The combined matrix is symmetric, so W is the transpose of the first
+    # rows of A \ E', where E is the rbf-poly evaluation matrix.
+    E = np.hstack((rbfmat(xe, ye, xind, yind, rbfPow, func=func), p))
+    W = np.linalg.solve(localMatrix(xind, yind, rbfPow, deg), E.T)
+    
+    return W[:len(xind),:].T
+
+################################################################################
+
+def interp(x, y, f, xe, ye, rbfPow=-1, deg=-1, nSubd=-1, mSubd=-1, reorder=False \
+, chunkSize=1000, nCenters=-1) :
+    """
+    Interpolate (x,y,f) to (xe,ye,fe_approx) using PHS RBFs and polynomials.
+    """
+    # x                                     x-coords where you KNOW the function
+    # y                                     y-coords where you KNOW the function
+    # f                                        known values of function on nodes
+    # xe                                    x-coords where you WANT the function
+    # ye                                    y-coords where you WANT the function
+    # OPTIONAL:
+    # rbfPow                                                 exponent of phs rbf
+    # deg                                     largest polynomial degree in basis
+    # nSubd                                    number of subdomains horizontally
+    # mSubd                                      number of subdomains vertically
+    # reorder                    sort the points by subdomain (see interpSorted)
+    # chunkSize                     max number of eval pts to evaluate at a time
+    # nCenters           max number of rbf centers per subdomain (least squares)
+    rbfPow, deg = basis(rbfPow, deg)
+    
+    # Normalize coordinates for good conditioning.
+    x, y, xe, ye = normalize(x, y, xe, ye)
+    
+    # Info (coords, half-width, half-length) about the rectangular subdomains.
+    xmc, ymc, w, ell = subdomains(x, y, xe, ye, deg, nSubd, mSubd)
+    
+    if reorder :
+        return interpSorted(x, y, f, xe, ye, xmc, ymc, w, ell, rbfPow, deg \
+        , chunkSize, nCenters)
+    
     fe_approx = np.zeros(len(xe))
     
-    for i in range(len(xmc)) :
+    for i, IND, values in interpCells(x, y, f, xe, ye, xmc, ymc, w, ell \
+    , rbfPow, deg, range(len(xmc)), chunkSize=chunkSize, nCenters=nCenters) :
+        fe_approx[IND] = values
+    
+    return fe_approx
+
+################################################################################
+
+def interpCells(x, y, f, xe, ye, xmc, ymc, w, ell, rbfPow, deg, cells, chunkSize=1000 \
+, nCenters=-1) :
+    """
+    Solve the local problems of some subdomains, one subdomain at a time.
+    """
+    # x                                             normalized x-coords of nodes
+    # y                                             normalized y-coords of nodes
+    # f                                        known values of function on nodes
+    # xe                                         normalized x-coords of eval pts
+    # ye                                         normalized y-coords of eval pts
+    # xmc                                  x-coords of centers of the subdomains
+    # ymc                                  y-coords of centers of the subdomains
+    # w                                             half-width of each subdomain
+    # ell                                          half-length of each subdomain
+    # rbfPow                                                 exponent of phs rbf
+    # deg                                     largest polynomial degree in basis
+    # cells                                       indices of subdomains to solve
+    # chunkSize                     max number of eval pts to evaluate at a time
+    # nCenters           max number of rbf centers per subdomain (least squares)
+    
+    # For each subdomain that has evaluation points, this yields the index of
+    # the subdomain, the indices of its evaluation points, and the values of
+    # the local interpolant there.
+    numP = int(round((deg + 1) * (deg + 2) / 2))
+    buf = np.zeros(0)
+    
+    for i in cells :
 
         # Get all nodes in the rectangular subdomain or adjacent subdomains.
         ind = inrectangle(x, y, xmc[i], ymc[i], 3*ell, 3*w)
@@ -386,42 +788,476 @@ def interp(x, y, f, xe, ye, rbfPow=-1, deg=-1, nSubd=-1, mSubd=-1) :
             print('numLocalNodes = {0:2d}'.format(len(ind)))
             s = "Not enough data for this polynomial degree."
             raise ValueError(s)
-        xind = x[ind]
-        yind = y[ind]
-
-        # Make the polynomial matrix.
-        p = polymat(xind, yind, deg)
 
         # Find evaluation points in the rectangular subdomain.
         IND = inrectangle(xe, ye, xmc[i], ymc[i], ell, w)
         if len(IND) == 0 :
             continue
-        xeIND = xe[IND]
-        yeIND = ye[IND]
 
         # Put together the RBF-poly approximant at the evaluation points.
-        if (rbfPow == -1) :
-            # Just do regular polynomial least squares.
-            lam = np.linalg.lstsq(p.T, f[ind], rcond=None)[0]
-            p = polymat(xeIND, yeIND, deg, kind="i")
-            fe_approx[IND] = p.T.dot(lam).flatten()
-        else :
-            # Make the rbf matrix (square).
-            A = rbfmat(xind, yind, xind, yind, rbfPow)
-            # Put them together to create the combined rbf-poly matrix (square).
-            A = np.hstack((A, p.T))
-            p = np.hstack((p, zp2))
-            A = np.vstack((A, p))
-            # Get function values and solve for coefficients, $lam.
-            lam = np.zeros((len(ind), 1))
-            lam[:,0] = f[ind]
-            lam = np.vstack((lam, zp1))
-            lam = np.linalg.solve(A, lam)
-            # Get rbf-poly evaluation matrix.
-            A = rbfmat(xeIND, yeIND, xind, yind, rbfPow, func=phs)
-            p = polymat(xeIND, yeIND, deg, kind="i").T
-            # Evaluate the interpolant at the evaluation points in the subdomain.
-            fe_approx[IND] = np.hstack((A, p)).dot(lam).flatten()
+        cen, lam = localFit(x[ind], y[ind], f[ind], rbfPow, deg, nCenters)
+        ind = np.asarray(ind)[cen]
+        if len(buf) < min(chunkSize, len(IND)) * len(ind) :
+            buf = np.zeros(chunkSize * len(ind))
+        yield i, IND, localEval(xe[IND], ye[IND], x[ind], y[ind], lam, rbfPow, deg \
+        , chunkSize=chunkSize, buf=buf)
+
+################################################################################
+
+def interpSorted(x, y, f, xe, ye, xmc, ymc, w, ell, rbfPow, deg, chunkSize=1000 \
+, nCenters=-1) :
+    """
+    The loop of interp, with the points sorted by subdomain beforehand.
+    """
+    # x                                             normalized x-coords of nodes
+    # y                                             normalized y-coords of nodes
+    # f                                        known values of function on nodes
+    # xe                                         normalized x-coords of eval pts
+    # ye                                         normalized y-coords of eval pts
+    # xmc                                  x-coords of centers of the subdomains
+    # ymc                                  y-coords of centers of the subdomains
+    # w                                             half-width of each subdomain
+    # ell                                          half-length of each subdomain
+    # rbfPow                                                 exponent of phs rbf
+    # deg                                     largest polynomial degree in basis
+    # chunkSize                     max number of eval pts to evaluate at a time
+    # nCenters           max number of rbf centers per subdomain (least squares)
+    
+    # Instead of searching through every point for every subdomain, the points
+    # are sorted by subdomain once.  The evaluation points of a subdomain are
+    # then a contiguous slice (a view), and the nodes of a 3 x 3 block are three
+    # contiguous slices, one for each row of subdomains.  Points that lie
+    # exactly on the edge between two subdomains are given to only one of them.
+    nSubd, mSubd = gridShape(xmc, ymc, w, ell)
+    numP = int(round((deg + 1) * (deg + 2) / 2))
+    perm, ptr = cellSort(x, y, xmc, ymc, w, ell)
+    x = x[perm]
+    y = y[perm]
+    f = f[perm]
+    PERM, PTR = cellSort(xe, ye, xmc, ymc, w, ell)
+    xe = xe[PERM]
+    ye = ye[PERM]
+    fe_approx = np.zeros(len(xe))
+    buf = np.zeros(0)
+    
+    # Visit the subdomains along a Z-order curve, so that consecutive stencils
+    # overlap and their nodes are still in cache.
+    row, col = np.divmod(np.arange(len(xmc)), nSubd)
+    
+    for i in np.argsort(morton(col, row), kind="stable") :
+        
+        # Get all nodes in the rectangular subdomain or adjacent subdomains.
+        c0 = max(col[i] - 1, 0)
+        c1 = min(col[i] + 1, nSubd - 1)
+        ind = [slice(ptr[j * nSubd + c0], ptr[j * nSubd + c1 + 1]) \
+        for j in range(max(row[i] - 1, 0), min(row[i] + 1, mSubd - 1) + 1)]
+        xind = np.concatenate([x[k] for k in ind])
+        yind = np.concatenate([y[k] for k in ind])
+        if len(xind) < round(1.5 * numP) :
+            print('numLocalNodes = {0:2d}'.format(len(xind)))
+            s = "Not enough data for this polynomial degree."
+            raise ValueError(s)
+        
+        # Find evaluation points in the rectangular subdomain.
+        IND = slice(PTR[i], PTR[i+1])
+        if PTR[i] == PTR[i+1] :
+            continue
+        
+        cen, lam = localFit(xind, yind, np.concatenate([f[k] for k in ind]), rbfPow, deg \
+        , nCenters)
+        xind = xind[cen]
+        yind = yind[cen]
+        if len(buf) < min(chunkSize, PTR[i+1] - PTR[i]) * len(xind) :
+            buf = np.zeros(chunkSize * len(xind))
+        fe_approx[IND] = localEval(xe[IND], ye[IND], xind, yind, lam, rbfPow, deg \
+        , chunkSize=chunkSize, buf=buf)
+    
+    # Undo the sorting, so the output is in the same order as the input.
+    out = np.zeros(len(xe))
+    out[PERM] = fe_approx
+    
+    return out
+
+################################################################################
+
+def interpKnn(x, y, f, xe, ye, rbfPow=-1, deg=-1, k=-1) :
+    """
+    Interpolate using stencils of the k nearest nodes, instead of rectangles.
+    """
+    # x                                     x-coords where you KNOW the function
+    # y                                     y-coords where you KNOW the function
+    # f                                        known values of function on nodes
+    # xe                                    x-coords where you WANT the function
+    # ye                                    y-coords where you WANT the function
+    # OPTIONAL:
+    # rbfPow                                                 exponent of phs rbf
+    # deg                                     largest polynomial degree in basis
+    # k                                          number of nodes in each stencil
+    
+    from scipy.spatial import cKDTree
+    
+    rbfPow, deg = basis(rbfPow, deg)
+    numP = int(round((deg + 1) * (deg + 2) / 2))
+    if k == -1 :
+        k = min(5 * numP, len(x))
+    if (k < round(1.5 * numP)) or (k > len(x)) :
+        print('numLocalNodes = {0:2d}'.format(k))
+        s = "Not enough data for this polynomial degree."
+        raise ValueError(s)
+    
+    # Normalize coordinates for good conditioning.
+    x, y, xe, ye = normalize(x, y, xe, ye)
+    tree = cKDTree(np.column_stack((x, y)))
+    
+    # Evaluation points are clustered by their nearest node, and each cluster
+    # uses the k nearest nodes of that node as its stencil.
+    near = tree.query(np.column_stack((xe, ye)), k=1)[1]
+    nodes, cluster = np.unique(near, return_inverse=True)
+    stencils = tree.query(np.column_stack((x[nodes], y[nodes])), k=k)[1]
+    
+    # Clusters with identical stencils share a single solve.
+    stencils, which = np.unique(np.sort(stencils, axis=1), axis=0, return_inverse=True)
+    which = which.flatten()[cluster]
+    order = np.argsort(which, kind="stable")
+    starts = np.searchsorted(which[order], np.arange(len(stencils) + 1))
+    print('{0:1d} stencils of {1:1d} nodes'.format(len(stencils), k))
+    
+    fe_approx = np.zeros(len(xe))
+    
+    for i in range(len(stencils)) :
+        ind = stencils[i]
+        IND = order[starts[i] : starts[i+1]]
+        lam = localFit(x[ind], y[ind], f[ind], rbfPow, deg)[1]
+        fe_approx[IND] = localEval(xe[IND], ye[IND], x[ind], y[ind], lam, rbfPow, deg)
+    
+    return fe_approx
+
+################################################################################
+
+def fit(x, y, f, xe, ye, rbfPow=-1, deg=-1, nSubd=-1, mSubd=-1, nCenters=-1) :
+    """
+    Solve every local problem once and return the fitted interpolant (a dict).
+    """
+    # x                                     x-coords where you KNOW the function
+    # y                                     y-coords where you KNOW the function
+    # f                                        known values of function on nodes
+    # xe                                 x-coords of the expected evaluation pts
+    # ye                                 y-coords of the expected evaluation pts
+    # OPTIONAL:
+    # rbfPow                                                 exponent of phs rbf
+    # deg                                     largest polynomial degree in basis
+    # nSubd                                    number of subdomains horizontally
+    # mSubd                                      number of subdomains vertically
+    # nCenters           max number of rbf centers per subdomain (least squares)
+    
+    # The subdomains are laid out exactly as they would be in interp, so the
+    # evaluation points help to define the computational domain.  The fitted
+    # interpolant can then be evaluated anywhere, using the evaluate function.
+    rbfPow, deg = basis(rbfPow, deg)
+    xavg, yavg, alp = shiftScale(x, y)
+    x, y, xe, ye = normalize(x, y, xe, ye)
+    xmc, ymc, w, ell = subdomains(x, y, xe, ye, deg, nSubd, mSubd)
+    numP = int(round((deg + 1) * (deg + 2) / 2))
+    
+    # The rbf centers (node indices) and coefficients of subdomain i are
+    # ind[ptr[i]:ptr[i+1]] and lam[lamPtr[i]:lamPtr[i+1]].
+    ptr = np.zeros(len(xmc) + 1, dtype=np.int64)
+    lamPtr = np.zeros(len(xmc) + 1, dtype=np.int64)
+    inds = []
+    lams = []
+    
+    for i in range(len(xmc)) :
+        ind = inrectangle(x, y, xmc[i], ymc[i], 3*ell, 3*w)
+        if len(ind) < round(1.5 * numP) :
+            print('numLocalNodes = {0:2d}'.format(len(ind)))
+            s = "Not enough data for this polynomial degree."
+            raise ValueError(s)
+        cen, lam = localFit(x[ind], y[ind], f[ind], rbfPow, deg, nCenters)
+        ind = np.asarray(ind)[cen]
+        inds.append(np.array(ind, dtype=np.int64))
+        lams.append(lam)
+        ptr[i+1] = ptr[i] + len(ind)
+        lamPtr[i+1] = lamPtr[i] + len(lam)
+    
+    model = {}
+    model["rbfPow"] = rbfPow
+    model["deg"] = deg
+    model["xavg"] = xavg
+    model["yavg"] = yavg
+    model["alp"] = alp
+    model["xmc"] = xmc
+    model["ymc"] = ymc
+    model["w"] = w
+    model["ell"] = ell
+    model["x"] = x
+    model["y"] = y
+    model["ptr"] = ptr
+    model["ind"] = np.hstack(inds)
+    model["lamPtr"] = lamPtr
+    model["lam"] = np.hstack(lams)
+    
+    return model
+
+################################################################################
+
+def evaluate(model, xe, ye) :
+    """
+    Evaluate an interpolant from fit (or IO.loadModel) at the points (xe,ye).
+    """
+    # model                                         fitted interpolant, from fit
+    # xe                                    x-coords where you WANT the function
+    # ye                                    y-coords where you WANT the function
+    
+    # Use the same shift and scale that was applied to the nodes.
+    xe = (np.asarray(xe) - model["xavg"]) / model["alp"]
+    ye = (np.asarray(ye) - model["yavg"]) / model["alp"]
+    
+    # Group the evaluation points by subdomain.  Only the nodes and coefficients
+    # of subdomains that contain evaluation points are ever touched.
+    cell = whichRectangle(xe, ye, model["xmc"], model["ymc"], model["w"], model["ell"])
+    order = np.argsort(cell, kind="stable")
+    cells, starts = np.unique(cell[order], return_index=True)
+    stops = np.hstack((starts[1:], len(order)))
+    
+    fe_approx = np.zeros(len(xe))
+    
+    for i, start, stop in zip(cells, starts, stops) :
+        IND = order[start:stop]
+        ind = model["ind"][model["ptr"][i] : model["ptr"][i+1]]
+        lam = model["lam"][model["lamPtr"][i] : model["lamPtr"][i+1]]
+        fe_approx[IND] = localEval(xe[IND], ye[IND], model["x"][ind], model["y"][ind] \
+        , lam, model["rbfPow"], model["deg"])
+    
+    return fe_approx
+
+################################################################################
+
+def blocks(x, y, xe, ye, rbfPow=-1, deg=-1, nSubd=-1, mSubd=-1, kind="i") :
+    """
+    Solve the local problems once for the coordinates only, without any f.
+    """
+    # x                                     x-coords where you KNOW the function
+    # y                                     y-coords where you KNOW the function
+    # xe                                    x-coords where you WANT the function
+    # ye                                    y-coords where you WANT the function
+    # OPTIONAL:
+    # rbfPow                                                 exponent of phs rbf
+    # deg                                     largest polynomial degree in basis
+    # nSubd                                    number of subdomains horizontally
+    # mSubd                                      number of subdomains vertically
+    # kind                "i" (values), "x" or "y" (derivatives) at the eval pts
+    
+    # The interpolant is linear in f, so each subdomain is described by the
+    # indices of its nodes (ind) and evaluation points (IND), together with the
+    # matrix W from localWeights.  Many sets of function values on the same
+    # coordinates can then be interpolated with applyBlocks, with no solves.
+    rbfPow, deg = basis(rbfPow, deg)
+    alp = shiftScale(x, y)[2]
+    x, y, xe, ye = normalize(x, y, xe, ye)
+    xmc, ymc, w, ell = subdomains(x, y, xe, ye, deg, nSubd, mSubd)
+    numP = int(round((deg + 1) * (deg + 2) / 2))
+    
+    # Derivatives in the normalized coordinates are scaled back to the original.
+    if kind == "i" :
+        scale = 1
+    elif (kind == "x") or (kind == "y") :
+        scale = 1 / alp
+    else :
+        s = "Optional variable \"kind\" should be \"i\", \"x\", or \"y\"."
+        raise ValueError(s)
+    
+    out = []
+    
+    for i in range(len(xmc)) :
+        ind = inrectangle(x, y, xmc[i], ymc[i], 3*ell, 3*w)
+        if len(ind) < round(1.5 * numP) :
+            print('numLocalNodes = {0:2d}'.format(len(ind)))
+            s = "Not enough data for this polynomial degree."
+            raise ValueError(s)
+        IND = inrectangle(xe, ye, xmc[i], ymc[i], ell, w)
+        if len(IND) == 0 :
+            continue
+        W = localWeights(xe[IND], ye[IND], x[ind], y[ind], rbfPow, deg, kind=kind)
+        out.append((np.array(IND, dtype=int), np.array(ind, dtype=int), scale * W))
+    
+    return out
+
+################################################################################
+
+def applyBlocks(blks, f, numEvalPts) :
+    """
+    Interpolate one set of function values, using the output of blocks.
+    """
+    # blks                                                      output of blocks
+    # f                                        known values of function on nodes
+    # numEvalPts                                     number of evaluation points
+
+    fe_approx = np.zeros(numEvalPts)
+    for IND, ind, W in blks :
+        fe_approx[IND] = W.dot(f[ind])
     
     return fe_approx
 
+################################################################################
+
+def operator(x, y, xe, ye, rbfPow=-1, deg=-1, nSubd=-1, mSubd=-1, kind="i") :
+    """
+    The whole interpolation as a sparse (CSR) matrix, so that fe = W.dot(f).
+    """
+    # x                                     x-coords where you KNOW the function
+    # y                                     y-coords where you KNOW the function
+    # xe                                    x-coords where you WANT the function
+    # ye                                    y-coords where you WANT the function
+    # OPTIONAL:
+    # rbfPow                                                 exponent of phs rbf
+    # deg                                     largest polynomial degree in basis
+    # nSubd                                    number of subdomains horizontally
+    # mSubd                                      number of subdomains vertically
+    # kind                "i" (values), "x" or "y" (derivatives) at the eval pts
+    
+    from scipy.sparse import csr_matrix
+    
+    blks = blocks(x, y, xe, ye, rbfPow, deg, nSubd, mSubd, kind)
+    
+    # An evaluation point on the edge of two subdomains gets its row from the
+    # later one, just like in interp.
+    owner = np.zeros(len(xe), dtype=int)
+    for b in range(len(blks)) :
+        owner[blks[b][0]] = b
+    
+    rows = []
+    cols = []
+    vals = []
+    for b in range(len(blks)) :
+        IND, ind, W = blks[b]
+        keep = owner[IND] == b
+        rows.append(np.repeat(IND[keep], len(ind)))
+        cols.append(np.tile(ind, np.count_nonzero(keep)))
+        vals.append(W[keep,:].flatten())
+    
+    return csr_matrix((np.hstack(vals), (np.hstack(rows), np.hstack(cols))) \
+    , shape=(len(xe), len(x)))
+
+################################################################################
+
+def localLoocv(xind, yind, find, rbfPow, deg, lu=None) :
+    """
+    Leave-one-out errors at the local nodes, without refitting (Rippa's trick).
+    """
+    # xind                                           x-coords of the local nodes
+    # yind                                           y-coords of the local nodes
+    # find                                    function values at the local nodes
+    # rbfPow                                                 exponent of phs rbf
+    # deg                                     largest polynomial degree in basis
+    # OPTIONAL:
+    # lu                factorization of localMatrix from scipy.linalg.lu_factor
+    
+    # If node k is left out, the error of the new interpolant at node k is
+    # lam[k] / inv(A)[k,k], so one factorization gives every error at once.
+    # For polynomial least squares, the same role is played by the residual
+    # and the diagonal of the hat matrix, r[k] / (1 - h[k]).
+    n = len(xind)
+    
+    if rbfPow == -1 :
+        Q = np.linalg.qr(polymat(xind, yind, deg).T)[0]
+        r = find - Q.dot(Q.T.dot(find))
+        h = np.sum(Q**2, axis=1)
+        return r / (1 - h)
+    
+    # Only the first n columns of inv(A) are needed.
+    if lu is None :
+        Ainv = np.linalg.inv(localMatrix(xind, yind, rbfPow, deg))[:,:n]
+    else :
+        from scipy.linalg import lu_solve
+        Ainv = lu_solve(lu, np.eye(len(lu[1]))[:,:n])
+    lam = Ainv.dot(find)
+    
+    return lam[:n] / np.diag(Ainv)
+
+################################################################################
+
+def loocv(x, y, f, xe, ye, rbfPow=-1, deg=-1, nSubd=-1, mSubd=-1) :
+    """
+    Estimate the leave-one-out cross-validation error at every node.
+    """
+    # x                                     x-coords where you KNOW the function
+    # y                                     y-coords where you KNOW the function
+    # f                                        known values of function on nodes
+    # xe                                    x-coords where you WANT the function
+    # ye                                    y-coords where you WANT the function
+    # OPTIONAL:
+    # rbfPow                                                 exponent of phs rbf
+    # deg                                     largest polynomial degree in basis
+    # nSubd                                    number of subdomains horizontally
+    # mSubd                                      number of subdomains vertically
+    rbfPow, deg = basis(rbfPow, deg)
+    x, y, xe, ye = normalize(x, y, xe, ye)
+    xmc, ymc, w, ell = subdomains(x, y, xe, ye, deg, nSubd, mSubd)
+    numP = int(round((deg + 1) * (deg + 2) / 2))
+    
+    # Each node gets the error from the local problem of its own subdomain,
+    # since that is the interpolant that would be used near the node.
+    cell = whichRectangle(x, y, xmc, ymc, w, ell)
+    err = np.zeros(len(x))
+    
+    for i in range(len(xmc)) :
+        ind = np.array(inrectangle(x, y, xmc[i], ymc[i], 3*ell, 3*w), dtype=int)
+        if len(ind) < round(1.5 * numP) :
+            print('numLocalNodes = {0:2d}'.format(len(ind)))
+            s = "Not enough data for this polynomial degree."
+            raise ValueError(s)
+        own = cell[ind] == i
+        if not np.any(own) :
+            continue
+        e = localLoocv(x[ind], y[ind], f[ind], rbfPow, deg)
+        err[ind[own]] = e[own]
+    
+    return err
+
+################################################################################
+
+def tune(x, y, f, xe, ye, rbfPows=(3, 5, 7), degs=(0, 1, 2, 3, 4), nSubd=-1, mSubd=-1) :
+    """
+    Sweep over (rbfPow, deg), and pick the pair with the smallest LOOCV error.
+    """
+    # x                                     x-coords where you KNOW the function
+    # y                                     y-coords where you KNOW the function
+    # f                                        known values of function on nodes
+    # xe                                    x-coords where you WANT the function
+    # ye                                    y-coords where you WANT the function
+    # OPTIONAL:
+    # rbfPows                                       rbf exponents to try (or -1)
+    # degs                                             polynomial degrees to try
+    # nSubd                                    number of subdomains horizontally
+    # mSubd                                      number of subdomains vertically
+    
+    # Errors are reported relative to the largest function value.
+    fmax = np.max(np.abs(f))
+    if fmax == 0 :
+        fmax = 1
+    
+    results = []
+    for rbfPow in rbfPows :
+        for deg in degs :
+            try :
+                err = loocv(x, y, f, xe, ye, rbfPow, deg, nSubd, mSubd) / fmax
+            except (ValueError, np.linalg.LinAlgError) as e :
+                print('rbfPow = {0:2d}, deg = {1:1d} failed: {2}'.format(rbfPow, deg, e))
+                continue
+            rms = np.sqrt(np.mean(err**2))
+            results.append((rms, np.max(np.abs(err)), rbfPow, deg))
+    
+    if len(results) == 0 :
+        s = "None of the (rbfPow, deg) combinations could be used."
+        raise ValueError(s)
+    
+    results.sort()
+    print('')
+    print('rbfPow  deg    rms LOOCV err    max LOOCV err')
+    for rms, mx, rbfPow, deg in results :
+        print('{0:6d}  {1:3d}  {2:15.6e}  {3:15.6e}'.format(rbfPow, deg, rms, mx))
+    rbfPow = results[0][2]
+    deg = results[0][3]
+    print('Best: rbfPow = {0:1d}, deg = {1:1d}'.format(rbfPow, deg))
+    
+    return rbfPow, deg
@@ -0,0 +1,147 @@
+#!/usr/bin/python
+"""
+Interpolate many sets of function values that share the same coordinates.
+The coordinate directory (x.txt, y.txt, xe.txt, ye.txt) is loaded only once,
+and every local problem is solved only once, for the coordinates alone (see
+rbf2.blocks).  After that, each data directory only costs loading its f.txt,
+a few small matrix-vector products, and saving its fe_approx.txt.
+
+A timing report for every job is saved as batchReport.txt in the coordinate
+directory.
+"""
+################################################################################
+
+import os
+from sys import argv, path
+from time import time
+
+path.append(".")
+import IO
+import rbf2
+
+################################################################################
+
+def helpString() :
+    s = "\n"
+    s += "\"rbfbatch2.py\": A script for interpolating many data directories that share coordinates.\n\n"
+    s += "This script accepts up to 6 command-line inputs:\n"
+    s += "(1) The path to the coordinates directory                      (default: .\\randomCoords).\n"
+    s += "(2) The jobs: \"all\" (every subfolder with f.txt), a manifest file\n"
+    s += "    with one data directory per line, or a comma-separated list  (default: all).\n"
+    s += "(3) The rbf exponent, an odd integer                           (default: 3).\n"
+    s += "(4) The polynomial degree, an integer from 0 up to 4           (default: 1).\n"
+    s += "(5) The number of subdomains going across, a positive integer  (default: auto calculate).\n"
+    s += "(6) The number of subdomains going down, a positive integer    (default: auto calculate).\n\n"
+    s += "Data directories in a manifest or a list are relative to the coordinates directory.\n\n"
+    return s
+
+################################################################################
+
+def numLines(fileName) :
+    with open(fileName) as fh :
+        return sum(1 for line in fh)
+
+################################################################################
+
+# Process the input.
+
+coordsDir = "randomCoords"
+jobs = "all"
+rbfPow = 3
+deg = 1
+nSubd = -1
+mSubd = -1
+
+argv = argv[1:]
+if len(argv) > 0 :
+    tmp = argv[0].lower()
+    if ("help" == tmp) or ("--help" == tmp) or ("-h" == tmp) :
+        print(helpString())
+        exit()
+    coordsDir = argv[0];  argv = argv[1:]
+    if not os.path.isdir(coordsDir) :
+        s = "First input must be a coordinates directory."
+        raise ValueError(s)
+
+if len(argv) > 0 :   jobs =     argv[0];  argv = argv[1:]
+if len(argv) > 0 : rbfPow = int(argv[0]);  argv = argv[1:]
+if len(argv) > 0 :    deg = int(argv[0]);  argv = argv[1:]
+if len(argv) > 0 :  nSubd = int(argv[0]);  argv = argv[1:]
+if len(argv) > 0 :  mSubd = int(argv[0]);  argv = argv[1:]
+
+if len(argv) > 0 :
+    s = "Too many inputs.  Max number of inputs is 6."
+    raise ValueError(s)
+
+################################################################################
+
+# Make the list of data directories.
+
+if jobs == "all" :
+    dataDirs = sorted([d for d in os.listdir(coordsDir) \
+    if os.path.isfile(os.path.join(coordsDir, d, "f.txt"))])
+elif os.path.isfile(jobs) :
+    with open(jobs) as fh :
+        dataDirs = [line.strip() for line in fh if line.strip() != ""]
+else :
+    dataDirs = [d.strip() for d in jobs.split(",") if d.strip() != ""]
+
+dataDirs = [os.path.join(coordsDir, d) for d in dataDirs]
+
+for dataDir in dataDirs :
+    if not os.path.isfile(os.path.join(dataDir, "f.txt")) :
+        s = "Data directory \"" + dataDir + "\" must contain function values."
+        raise ValueError(s)
+
+if len(dataDirs) == 0 :
+    s = "No data directories were found."
+    raise ValueError(s)
+
+# Check every job before any work is done, so that one bad data directory
+# cannot stop the batch part way through.
+numNodes = numLines(os.path.join(coordsDir, "x.txt"))
+for dataDir in dataDirs :
+    if numLines(os.path.join(dataDir, "f.txt")) != numNodes :
+        s = "Data directory \"" + dataDir + "\" has the wrong number of function values."
+        raise ValueError(s)
+
+################################################################################
+
+# Load the coordinates and solve the local problems, once for every job.
+
+setupTime = time()
+x  = IO.loadArray(os.path.join(coordsDir, "x.txt"))
+y  = IO.loadArray(os.path.join(coordsDir, "y.txt"))
+xe = IO.loadArray(os.path.join(coordsDir, "xe.txt"))
+ye = IO.loadArray(os.path.join(coordsDir, "ye.txt"))
+blks = rbf2.blocks(x, y, xe, ye, rbfPow=rbfPow, deg=deg, nSubd=nSubd, mSubd=mSubd)
+setupTime = time() - setupTime
+print("setupTime = " + str(setupTime))
+
+################################################################################
+
+# Process every job, and keep track of how long each step takes.
+
+report = []
+
+for dataDir in dataDirs :
+    loadTime = time()
+    f = IO.loadArray(os.path.join(dataDir, "f.txt"))
+    loadTime = time() - loadTime
+    computeTime = time()
+    fe_approx = rbf2.applyBlocks(blks, f, len(xe))
+    computeTime = time() - computeTime
+    saveTime = time()
+    IO.saveArray(os.path.join(dataDir, "fe_approx.txt"), fe_approx)
+    saveTime = time() - saveTime
+    report.append((dataDir, loadTime, computeTime, saveTime))
+    print(dataDir + ": computeTime = " + str(computeTime))
+
+with open(os.path.join(coordsDir, "batchReport.txt"), "w") as fh :
+    fh.write('{0:<40s} {1:>12s} {2:>12s} {3:>12s} {4:>12s}\n' \
+    .format("dataDir", "load (s)", "compute (s)", "save (s)", "total (s)"))
+    fh.write('{0:<40s} {1:>12s} {2:12.6f} {3:>12s} {4:12.6f}\n' \
+    .format("(coordinates and local solves)", "", setupTime, "", setupTime))
+    for dataDir, loadTime, computeTime, saveTime in report :
+        fh.write('{0:<40s} {1:12.6f} {2:12.6f} {3:12.6f} {4:12.6f}\n'.format(dataDir \
+        , loadTime, computeTime, saveTime, loadTime + computeTime + saveTime))
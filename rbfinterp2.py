@@ -110,6 +110,36 @@ if os.path.isfile(os.path.join(dataDir, "fe_approx.txt")) :
 # print("computeTime = " + str(computeTime))
 # IO.saveArray(os.path.join(dataDir, "fe_approx.txt"), fe_approx)
 
+# # Load everything, let autotune pick the subdomains and how to run, in python.
+# # The sharded mode starts worker processes, which re-run this script (on
+# # Windows and macOS) unless it is guarded like this.
+# if __name__ == "__main__" :
+#     import autotune
+#     x  = IO.loadArray(os.path.join(dataDir, "..", "x.txt"))
+#     y  = IO.loadArray(os.path.join(dataDir, "..", "y.txt"))
+#     f  = IO.loadArray(os.path.join(dataDir, "f.txt"))
+#     xe = IO.loadArray(os.path.join(dataDir, "..", "xe.txt"))
+#     ye = IO.loadArray(os.path.join(dataDir, "..", "ye.txt"))
+#     choice = autotune.autotune(x, y, f, xe, ye, rbfPow=rbfPow, deg=deg)
+#     IO.saveArray(os.path.join(dataDir, "fe_approx.txt"), choice["fe_approx"])
+
+# # Load, interpolate and save in python, with the I/O overlapping the solves.
+# import pipeline
+# computeTime = time()
+# pipeline.run(dataDir, rbfPow=rbfPow, deg=deg, nSubd=nSubd, mSubd=mSubd)
+# computeTime = time() - computeTime
+# print("computeTime = " + str(computeTime))
+
+# # Interpolate in python, out-of-core, one tile of subdomains at a time.
+# import tiles
+# computeTime = time()
+# tiles.interp(os.path.join(dataDir, "..", "x.txt"), os.path.join(dataDir, "..", "y.txt") \
+# , os.path.join(dataDir, "f.txt"), os.path.join(dataDir, "..", "xe.txt") \
+# , os.path.join(dataDir, "..", "ye.txt"), os.path.join(dataDir, "fe_approx.txt") \
+# , rbfPow=rbfPow, deg=deg, nSubd=nSubd, mSubd=mSubd)
+# computeTime = time() - computeTime
+# print("computeTime = " + str(computeTime))
+
 # # Load everything and interpolate in perl.
 # os.system("perl " + os.path.join("perl", "rbfinterp2.pl") + " " + dataDir + " " + \
 # checkError + " " + str(rbfPow) + " " + str(deg) + " " + str(nSubd) + " " + str(mSubd))
@@ -0,0 +1,34 @@
+#!/usr/bin/python
+"""
+Start a worker for shards.interp (with spawn=False) on this machine.  The
+worker connects to the coordinator, solves the shards that it is sent, and
+then quits when there are no more shards left.  The authkey must be the same
+secret that was given to shards.interp.
+"""
+################################################################################
+
+from sys import argv, path
+
+path.append(".")
+import shards
+
+################################################################################
+
+# Process the input.
+
+host = "localhost"
+port = -1
+authkey = ""
+
+argv = argv[1:]
+if len(argv) > 0 :    host =     argv[0];  argv = argv[1:]
+if len(argv) > 0 :    port = int(argv[0]);  argv = argv[1:]
+if len(argv) > 0 : authkey =     argv[0];  argv = argv[1:]
+
+if (port == -1) or (authkey == "") :
+    s = "Usage: python shardWorker.py host port authkey"
+    raise ValueError(s)
+
+################################################################################
+
+shards.work((host, port), authkey.encode())
@@ -0,0 +1,272 @@
+#!/usr/bin/python
+"""
+A sharded version of rbf2.interp, for jobs that are too big for one machine.
+The grid of rectangular subdomains is split into nShard x mShard blocks
+(shards).  A coordinator sends each worker one shard at a time, containing only
+the nodes of the shard plus one ring of adjacent subdomains (the halo needed
+by the 3 x 3 stencils), and the evaluation points of the shard.  The workers
+send back their local results, which the coordinator puts together.
+
+Workers talk to the coordinator over sockets, so they can be started on other
+machines with shardWorker.py, or started on this machine automatically.  The
+messages are pickled, so coordinator and workers must share a secret authkey.
+Every local problem is set up exactly as in rbf2.interp, so the results match.
+
+With spawn=True, the workers are started with multiprocessing.  With the spawn
+or forkserver start method (Windows, macOS, and Linux from Python 3.14), each
+worker re-imports the caller's __main__, so a script that calls interp must do
+so under if __name__ == "__main__".  Otherwise the workers die before they
+connect, and interp raises a RuntimeError.
+"""
+################################################################################
+
+import os
+import socket
+from multiprocessing import Process
+from multiprocessing.connection import Client, Connection, wait
+from multiprocessing.connection import answer_challenge, deliver_challenge
+from time import time
+import numpy as np
+
+import rbf2
+
+################################################################################
+
+def shards(nSubd, mSubd, nShard, mShard) :
+    """
+    Split the nSubd x mSubd grid of subdomains into nShard x mShard blocks.
+    """
+    # nSubd                                    number of subdomains horizontally
+    # mSubd                                      number of subdomains vertically
+    # nShard                                       number of shards horizontally
+    # mShard                                         number of shards vertically
+    
+    blocks = []
+    for rows in np.array_split(np.arange(mSubd), mShard) :
+        for cols in np.array_split(np.arange(nSubd), nShard) :
+            if (len(rows) > 0) and (len(cols) > 0) :
+                blocks.append((rows[:,np.newaxis] * nSubd + cols).flatten())
+    
+    return blocks
+
+################################################################################
+
+def inbox(x, y, xlo, xhi, ylo, yhi) :
+    """
+    Index of all points in [xlo,xhi] x [ylo,yhi], in their original order.
+    """
+    return np.nonzero((x >= xlo) & (x <= xhi) & (y >= ylo) & (y <= yhi))[0]
+
+################################################################################
+
+def job(x, y, f, xe, ye, xmc, ymc, w, ell, rbfPow, deg, nCenters, cells) :
+    """
+    Everything a worker needs to solve one shard (nodes include the halo).
+    """
+    # The worker repeats the exact search done in rbf2.interp, so the boxes
+    # here only need to contain everything that the search could find.  They
+    # are made slightly bigger, so that round-off can not leave anything out.
+    tol = 1e-6 * (w + ell)
+    xlo = np.min(xmc[cells])
+    xhi = np.max(xmc[cells])
+    ylo = np.min(ymc[cells])
+    yhi = np.max(ymc[cells])
+    ind = inbox(x, y, xlo - 3*w - tol, xhi + 3*w + tol, ylo - 3*ell - tol, yhi + 3*ell + tol)
+    IND = inbox(xe, ye, xlo - w - tol, xhi + w + tol, ylo - ell - tol, yhi + ell + tol)
+    
+    msg = {}
+    msg["x"] = x[ind]
+    msg["y"] = y[ind]
+    msg["f"] = f[ind]
+    msg["xe"] = xe[IND]
+    msg["ye"] = ye[IND]
+    msg["IND"] = IND
+    msg["xmc"] = xmc
+    msg["ymc"] = ymc
+    msg["w"] = w
+    msg["ell"] = ell
+    msg["rbfPow"] = rbfPow
+    msg["deg"] = deg
+    msg["nCenters"] = nCenters
+    msg["cells"] = cells
+    
+    return msg
+
+################################################################################
+
+def work(address, authkey) :
+    """
+    Connect to the coordinator, and solve shards until there are none left.
+    """
+    # address                                    (host, port) of the coordinator
+    # authkey                           shared secret, the same as coordinator's
+    
+    conn = Client(address, authkey=authkey)
+    
+    while True :
+        # The coordinator closes the connection if it gives up on the job.
+        try :
+            msg = conn.recv()
+        except (EOFError, OSError) :
+            break
+        if msg is None :
+            break
+        try :
+            results = []
+            for i, IND, values in rbf2.interpCells(msg["x"], msg["y"], msg["f"] \
+            , msg["xe"], msg["ye"], msg["xmc"], msg["ymc"], msg["w"], msg["ell"] \
+            , msg["rbfPow"], msg["deg"], msg["cells"], nCenters=msg["nCenters"]) :
+                # Send back indices into the full array of evaluation points.
+                results.append((i, msg["IND"][IND], values))
+            conn.send(results)
+        except Exception as e :
+            conn.send(e)
+    
+    conn.close()
+
+################################################################################
+
+def accept(sock, authkey, numWorkers, procs, timeout) :
+    """
+    Wait for numWorkers workers to connect, and check that they know authkey.
+    """
+    # sock                                       listening socket of coordinator
+    # authkey                           shared secret that workers must also use
+    # numWorkers                                   number of workers to wait for
+    # procs                             worker processes started on this machine
+    # timeout                      max seconds to wait for workers (-1: forever)
+    
+    # The socket is polled once a second, so that a spawned worker that dies
+    # before it connects (or a timeout) is noticed, instead of waiting forever.
+    sock.settimeout(1)
+    startTime = time()
+    conns = []
+    
+    try :
+        while len(conns) < numWorkers :
+            try :
+                s = sock.accept()[0]
+            except socket.timeout :
+                if (len(procs) > 0) and (sum(proc.is_alive() for proc in procs) < numWorkers) :
+                    s = "A worker process died before connecting to the coordinator."
+                    raise RuntimeError(s)
+                if (timeout != -1) and (time() - startTime > timeout) :
+                    s = "Timed out waiting for workers to connect."
+                    raise RuntimeError(s)
+                continue
+            s.settimeout(None)
+            conns.append(Connection(s.detach()))
+            # Same handshake as multiprocessing.connection.Listener.accept.
+            deliver_challenge(conns[-1], authkey)
+            answer_challenge(conns[-1], authkey)
+    except :
+        for conn in conns :
+            conn.close()
+        raise
+    
+    return conns
+
+################################################################################
+
+def interp(x, y, f, xe, ye, rbfPow=-1, deg=-1, nSubd=-1, mSubd=-1, nShard=2 \
+, mShard=2, numWorkers=-1, address=("localhost", 0), authkey=None, spawn=True \
+, nCenters=-1, timeout=-1) :
+    """
+    Interpolate like rbf2.interp, with the shards solved by separate workers.
+    """
+    # x                                     x-coords where you KNOW the function
+    # y                                     y-coords where you KNOW the function
+    # f                                        known values of function on nodes
+    # xe                                    x-coords where you WANT the function
+    # ye                                    y-coords where you WANT the function
+    # OPTIONAL:
+    # rbfPow                                                 exponent of phs rbf
+    # deg                                     largest polynomial degree in basis
+    # nSubd                                    number of subdomains horizontally
+    # mSubd                                      number of subdomains vertically
+    # nShard                                       number of shards horizontally
+    # mShard                                         number of shards vertically
+    # numWorkers                        number of workers (default: 1 per shard)
+    # address                              (host, port) to listen on for workers
+    # authkey         shared secret that workers must also use (bytes), required
+    #              if spawn is False, and made up at random if spawn is True
+    # spawn                      start the workers on this machine automatically
+    # nCenters           max number of rbf centers per subdomain (least squares)
+    # timeout                      max seconds to wait for workers (-1: forever)
+    
+    # Messages are pickled, so anyone who knows the secret can run code here.
+    if authkey is None :
+        if spawn :
+            authkey = os.urandom(32)
+        else :
+            s = "A secret authkey must be supplied when the workers are not spawned."
+            raise ValueError(s)
+    
+    rbfPow, deg = rbf2.basis(rbfPow, deg)
+    
+    # The coordinator does the same setup as rbf2.interp.
+    x, y, xe, ye = rbf2.normalize(x, y, xe, ye)
+    xmc, ymc, w, ell = rbf2.subdomains(x, y, xe, ye, deg, nSubd, mSubd)
+    nSubd, mSubd = rbf2.gridShape(xmc, ymc, w, ell)
+    
+    jobs = [job(x, y, f, xe, ye, xmc, ymc, w, ell, rbfPow, deg, nCenters, cells) \
+    for cells in shards(nSubd, mSubd, nShard, mShard)]
+    if numWorkers == -1 :
+        numWorkers = len(jobs)
+    numWorkers = min(numWorkers, len(jobs))
+    
+    # Every worker may try to connect before the first one is accepted, so the
+    # backlog has to have room for all of them.
+    sock = socket.create_server(address, backlog=max(numWorkers, 64))
+    address = sock.getsockname()[:2]
+    procs = []
+    conns = []
+    if spawn :
+        for k in range(numWorkers) :
+            procs.append(Process(target=work, args=(address, authkey)))
+            procs[-1].start()
+    else :
+        print('Waiting for {0:1d} workers at {1}'.format(numWorkers, address))
+    
+    try :
+        
+        conns = accept(sock, authkey, numWorkers, procs, timeout)
+        
+        # Hand out one shard to each worker, and another whenever one finishes.
+        results = []
+        busy = []
+        for conn in conns :
+            conn.send(jobs.pop())
+            busy.append(conn)
+        while len(busy) > 0 :
+            for conn in wait(busy) :
+                msg = conn.recv()
+                if isinstance(msg, Exception) :
+                    raise msg
+                results.extend(msg)
+                if len(jobs) > 0 :
+                    conn.send(jobs.pop())
+                else :
+                    conn.send(None)
+                    busy.remove(conn)
+    
+    finally :
+        # On an error, the other workers may still be busy or waiting for a
+        # shard.  Closing their connections tells them to quit.
+        sock.close()
+        for conn in conns :
+            conn.close()
+        for proc in procs :
+            proc.join(5)
+            if proc.is_alive() :
+                proc.terminate()
+                proc.join()
+    
+    # Points on the edge of two subdomains keep the value of the later one,
+    # just like in rbf2.interp.
+    fe_approx = np.zeros(len(xe))
+    results.sort(key=lambda result : result[0])
+    for i, IND, values in results :
+        fe_approx[IND] = values
+    
+    return fe_approx
@@ -0,0 +1,233 @@
+#!/usr/bin/python
+"""
+An out-of-core ("tiled") version of rbf2.interp, for node sets that are too big
+to fit in memory.  The text files are only ever read a chunk at a time.  First
+the nodes and evaluation points are sorted on disk into one bucket file per
+rectangular subdomain.  Then the subdomains are solved one at a time, keeping
+only the buckets of the current 3 x 3 block of subdomains in memory (a sliding
+window), and each result is written straight to a memory-mapped file on disk.
+Peak memory depends on the chunk size and the size of a subdomain, not on the
+total number of nodes.
+"""
+################################################################################
+
+import os
+import shutil
+from itertools import repeat
+import tempfile
+import numpy as np
+
+import IO
+import rbf2
+
+################################################################################
+
+# Records stored in the bucket files, for nodes and for evaluation points.
+NODE = np.dtype([("x", np.float64), ("y", np.float64), ("f", np.float64)])
+EVAL = np.dtype([("x", np.float64), ("y", np.float64), ("k", np.int64)])
+
+################################################################################
+
+def stats(xFile, yFile, chunkSize) :
+    """
+    Count, sum, min and max of the coordinates, in one pass through the files.
+    """
+    # xFile                                             file containing x-coords
+    # yFile                                             file containing y-coords
+    # chunkSize                               number of values to read at a time
+    
+    n = 0
+    xsum = ysum = 0
+    xmin = ymin = np.inf
+    xmax = ymax = -np.inf
+    
+    for x, y in zip(IO.loadChunks(xFile, chunkSize), IO.loadChunks(yFile, chunkSize)) :
+        n += len(x)
+        xsum += np.sum(x)
+        ysum += np.sum(y)
+        xmin = min(xmin, np.min(x))
+        xmax = max(xmax, np.max(x))
+        ymin = min(ymin, np.min(y))
+        ymax = max(ymax, np.max(y))
+    
+    return n, xsum, ysum, xmin, xmax, ymin, ymax
+
+################################################################################
+
+def chunks(xFile, yFile, xavg, yavg, alp, chunkSize, fFile="") :
+    """
+    Read normalized coordinates (and function values) a chunk at a time.
+    """
+    # xFile                                             file containing x-coords
+    # yFile                                             file containing y-coords
+    # xavg                                              shift in the x-direction
+    # yavg                                              shift in the y-direction
+    # alp                                                    scale of the coords
+    # chunkSize                               number of values to read at a time
+    # fFile                             file containing function values (if any)
+    
+    x = IO.loadChunks(xFile, chunkSize)
+    y = IO.loadChunks(yFile, chunkSize)
+    if fFile == "" :
+        f = repeat(None)
+    else :
+        f = IO.loadChunks(fFile, chunkSize)
+    
+    for xc, yc, fc in zip(x, y, f) :
+        yield (xc - xavg) / alp, (yc - yavg) / alp, fc
+
+################################################################################
+
+def bucketName(workDir, kind, i) :
+    return os.path.join(workDir, kind + "_" + str(i) + ".bin")
+
+################################################################################
+
+def saveBuckets(workDir, kind, records, cell) :
+    """
+    Append each record to the bucket file of the subdomain that it belongs to.
+    """
+    # workDir                                folder where the buckets are stored
+    # kind                                                    "nodes" or "evals"
+    # records                                        structured array of records
+    # cell                                    index of subdomain for each record
+    
+    order = np.argsort(cell, kind="stable")
+    cells, starts = np.unique(cell[order], return_index=True)
+    stops = np.hstack((starts[1:], len(order)))
+    
+    for i, start, stop in zip(cells, starts, stops) :
+        with open(bucketName(workDir, kind, i), "ab") as fh :
+            records[order[start:stop]].tofile(fh)
+
+################################################################################
+
+def loadBucket(workDir, kind, i, dtype) :
+    fileName = bucketName(workDir, kind, i)
+    if not os.path.isfile(fileName) :
+        return np.zeros(0, dtype=dtype)
+    return np.fromfile(fileName, dtype=dtype)
+
+################################################################################
+
+def interp(xFile, yFile, fFile, xeFile, yeFile, feFile, rbfPow=-1, deg=-1 \
+, nSubd=-1, mSubd=-1, chunkSize=100000, workDir="", nCenters=-1) :
+    """
+    Interpolate like rbf2.interp, but read from and write to files, tile by tile.
+    """
+    # xFile                                        file of x-coords of the nodes
+    # yFile                                        file of y-coords of the nodes
+    # fFile                                 file of function values at the nodes
+    # xeFile                                        file of x-coords of eval pts
+    # yeFile                                        file of y-coords of eval pts
+    # feFile                                  output file for approximate values
+    # OPTIONAL:
+    # rbfPow                                                 exponent of phs rbf
+    # deg                                     largest polynomial degree in basis
+    # nSubd                                    number of subdomains horizontally
+    # mSubd                                      number of subdomains vertically
+    # chunkSize                               number of values to read at a time
+    # workDir       folder to make the (temporary) bucket folder in, for example
+    #                   on a big disk (default: the system's temporary folder)
+    # nCenters           max number of rbf centers per subdomain (least squares)
+    rbfPow, deg = rbf2.basis(rbfPow, deg)
+    numP = int(round((deg + 1) * (deg + 2) / 2))
+    
+    # Shift and scale exactly as rbf2.normalize does, but one chunk at a time.
+    n, xsum, ysum, xmin, xmax, ymin, ymax = stats(xFile, yFile, chunkSize)
+    xavg = xsum / n
+    yavg = ysum / n
+    alp = (max(xmax - xavg, xavg - xmin) + max(ymax - yavg, yavg - ymin)) / 2
+    ne, _, _, xemin, xemax, yemin, yemax = stats(xeFile, yeFile, chunkSize)
+    
+    # The rectangular computational domain, [a,b] x [c,d].
+    a = (min(xmin, xemin) - xavg) / alp
+    b = (max(xmax, xemax) - xavg) / alp
+    c = (min(ymin, yemin) - yavg) / alp
+    d = (max(ymax, yemax) - yavg) / alp
+    
+    # Choose the subdomains like rbf2.rectangles, but count the nodes in each
+    # subdomain with one pass through the files, instead of holding them all.
+    if (nSubd == -1) or (mSubd == -1) :
+        nSubd, mSubd = rbf2.startingShape(a, b, c, d)
+        while True :
+            xmc, ymc, w, ell = rbf2.grid(a, b, c, d, nSubd, mSubd)
+            counts = np.zeros(nSubd * mSubd, dtype=np.int64)
+            for x, y, _ in chunks(xFile, yFile, xavg, yavg, alp, chunkSize) :
+                counts += np.bincount(rbf2.whichRectangle(x, y, xmc, ymc, w, ell) \
+                , minlength=len(counts))
+            if np.min(rbf2.stencilCounts(counts, nSubd, mSubd)) < 10 * numP :
+                break
+            nSubd *= 2
+            mSubd *= 2
+    xmc, ymc, w, ell = rbf2.grid(a, b, c, d, nSubd, mSubd)
+    print('{0:1d} x {1:1d} subdomains'.format(nSubd, mSubd))
+    
+    # Buckets are appended to, so every run gets a fresh folder of its own,
+    # even if the same workDir is used again (or by another run at once).
+    if workDir == "" :
+        workDir = None
+    workDir = tempfile.mkdtemp(prefix="rbf2tiles", dir=workDir)
+    
+    try :
+        
+        # Sort the nodes and the evaluation points into buckets on disk.
+        for x, y, f in chunks(xFile, yFile, xavg, yavg, alp, chunkSize, fFile) :
+            records = np.zeros(len(x), dtype=NODE)
+            records["x"] = x
+            records["y"] = y
+            records["f"] = f
+            cell = rbf2.whichRectangle(x, y, xmc, ymc, w, ell)
+            saveBuckets(workDir, "nodes", records, cell)
+        k = 0
+        for x, y, _ in chunks(xeFile, yeFile, xavg, yavg, alp, chunkSize) :
+            records = np.zeros(len(x), dtype=EVAL)
+            records["x"] = x
+            records["y"] = y
+            records["k"] = np.arange(k, k + len(x))
+            k += len(x)
+            cell = rbf2.whichRectangle(x, y, xmc, ymc, w, ell)
+            saveBuckets(workDir, "evals", records, cell)
+        
+        # Results go straight to disk, as soon as each subdomain is finished.
+        fe_approx = np.memmap(os.path.join(workDir, "fe_approx.bin") \
+        , dtype=np.float64, mode="w+", shape=(ne,))
+        
+        # Sliding window of node buckets, for the current 3 x 3 block.
+        window = {}
+        
+        for i in range(len(xmc)) :
+            
+            row, col = divmod(i, nSubd)
+            near = [jj * nSubd + ii for jj in range(row - 1, row + 2) \
+            for ii in range(col - 1, col + 2) if (0 <= jj < mSubd) and (0 <= ii < nSubd)]
+            for j in list(window) :
+                if j not in near :
+                    del window[j]
+            for j in near :
+                if j not in window :
+                    window[j] = loadBucket(workDir, "nodes", j, NODE)
+            
+            # Get all nodes in the rectangular subdomain or adjacent subdomains.
+            nodes = np.concatenate([window[j] for j in near])
+            if len(nodes) < round(1.5 * numP) :
+                print('numLocalNodes = {0:2d}'.format(len(nodes)))
+                s = "Not enough data for this polynomial degree."
+                raise ValueError(s)
+            
+            # Find evaluation points in the rectangular subdomain.
+            evals = loadBucket(workDir, "evals", i, EVAL)
+            if len(evals) == 0 :
+                continue
+            
+            cen, lam = rbf2.localFit(nodes["x"], nodes["y"], nodes["f"], rbfPow, deg \
+            , nCenters)
+            fe_approx[evals["k"]] = rbf2.localEval(evals["x"], evals["y"] \
+            , nodes["x"][cen], nodes["y"][cen], lam, rbfPow, deg)
+        
+        fe_approx.flush()
+        IO.saveChunks(feFile, (fe_approx[k : k+chunkSize] for k in range(0, ne, chunkSize)))
+        del fe_approx
+    
+    finally :
+        shutil.rmtree(workDir)
@@ -0,0 +1,72 @@
+#!/usr/bin/python
+"""
+Choose the rbf exponent and the polynomial degree for your data, without
+needing any known values at the evaluation points.  Every combination is
+scored by its leave-one-out cross-validation (LOOCV) error, which is found
+from each local linear system in closed form, so no extra fits are needed.
+
+The coordinate directory and $dataDir should be set up in the same way as for
+the main script rbfinterp2.py (only f.txt is needed in $dataDir).
+"""
+################################################################################
+
+import os
+from sys import argv, path
+
+path.append(".")
+import IO
+import rbf2
+
+################################################################################
+
+def helpString() :
+    s = "\n"
+    s += "\"tuneParams.py\": A script for choosing the rbf exponent and polynomial degree.\n\n"
+    s += "This script accepts up to 3 command-line inputs:\n"
+    s += "(1) The path to the folder that contains your function values  (default: .\\randomCoords\\smoothData).\n"
+    s += "(2) The number of subdomains going across, a positive integer  (default: auto calculate).\n"
+    s += "(3) The number of subdomains going down, a positive integer    (default: auto calculate).\n\n"
+    return s
+
+################################################################################
+
+# Process the input.
+
+dataDir = os.path.join("randomCoords", "smoothData")
+nSubd = -1
+mSubd = -1
+
+argv = argv[1:]
+if len(argv) > 0 :
+    tmp = argv[0].lower()
+    if ("help" == tmp) or ("--help" == tmp) or ("-h" == tmp) :
+        print(helpString())
+        exit()
+    dataDir = argv[0];  argv = argv[1:]
+    if not os.path.isdir(dataDir) :
+        s = "First input must be a data directory."
+        raise ValueError(s)
+    elif not os.path.isfile(os.path.join(dataDir, "f.txt")) :
+        s = "Data directory must contain function values."
+        raise ValueError(s)
+
+if len(argv) > 0 :  nSubd = int(argv[0]);  argv = argv[1:]
+if len(argv) > 0 :  mSubd = int(argv[0]);  argv = argv[1:]
+
+if len(argv) > 0 :
+    s = "Too many inputs.  Max number of inputs is 3."
+    raise ValueError(s)
+
+################################################################################
+
+x  = IO.loadArray(os.path.join(dataDir, "..", "x.txt"))
+y  = IO.loadArray(os.path.join(dataDir, "..", "y.txt"))
+f  = IO.loadArray(os.path.join(dataDir, "f.txt"))
+xe = IO.loadArray(os.path.join(dataDir, "..", "xe.txt"))
+ye = IO.loadArray(os.path.join(dataDir, "..", "ye.txt"))
+
+rbfPow, deg = rbf2.tune(x, y, f, xe, ye, nSubd=nSubd, mSubd=mSubd)
+
+print("\nTo use these, run:")
+print("python rbfinterp2.py " + dataDir + " n " + str(rbfPow) + " " + str(deg) \
++ " " + str(nSubd) + " " + str(mSubd))